@@ -0,0 +1,74 @@
+"""Time plan_assignments on synthetic cohorts against a linear scan per trainee.
+
+Run from the repo root:
+    python -m benchmarks.bench_auto_assign --trainees 50000 --agents 10000
+"""
+from bson.objectid import ObjectId
+import argparse
+import random
+import time
+import os
+
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+from services.assignments import plan_assignments, MAX_TRAINEES_PER_AGENT  # noqa: E402
+
+PROFESSIONS = ["nursing", "software engineering", "accounting", "agriculture", "teaching"]
+
+
+def make_cohort(trainees, agents, seed):
+    rng = random.Random(seed)
+    agent_docs = [{
+        "_id": ObjectId(),
+        "username": f"agent{i}",
+        "profession": rng.choice(PROFESSIONS),
+        "trainees_assigned": [ObjectId() for _ in range(rng.randrange(MAX_TRAINEES_PER_AGENT))],
+    } for i in range(agents)]
+    trainee_docs = [{"_id": ObjectId(), "username": f"trainee{i}"} for i in range(trainees)]
+    return agent_docs, trainee_docs
+
+
+def linear_plan(agents, trainees, profession_weights=None):
+    # What a straightforward implementation does: scan every agent per trainee
+    weights = profession_weights or {}
+    load = {}
+    for agent in agents:
+        if weights.get(agent["profession"], 1) > 0:
+            load[agent["_id"]] = [len(agent["trainees_assigned"]), weights.get(agent["profession"], 1), agent]
+    plan = []
+    for trainee in trainees:
+        open_agents = [entry for entry in load.values() if entry[0] < MAX_TRAINEES_PER_AGENT]
+        if not open_agents:
+            break
+        entry = min(open_agents, key=lambda entry: entry[0] / entry[1])
+        entry[0] += 1
+        plan.append((entry[2], trainee))
+    return plan
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--trainees", type=int, default=20000)
+    parser.add_argument("--agents", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--skip-linear", action="store_true", help="the linear scan is slow on big cohorts")
+    args = parser.parse_args()
+
+    agents, trainees = make_cohort(args.trainees, args.agents, args.seed)
+    weights = {"nursing": 2, "agriculture": 0.5}
+    for label, profession_weights in [("unweighted", None), ("weighted", weights)]:
+        plan, heap_ms = timed(plan_assignments, agents, trainees, profession_weights)
+        line = f"{label:<11} planned {len(plan):>7}   heap {heap_ms:9.1f}ms"
+        if not args.skip_linear:
+            linear, linear_ms = timed(linear_plan, agents, trainees, profession_weights)
+            line += f"   linear {linear_ms:9.1f}ms   same count {len(linear) == len(plan)}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
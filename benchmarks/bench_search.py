@@ -0,0 +1,128 @@
+"""Time /admin/search's query path against a seeded local MongoDB.
+
+Seeds --docs application forms into a scratch database (dropped first),
+builds the same indexes the app uses, then times ranked prefix searches
+against a case-insensitive regex scan, which is what searching without
+search_terms comes down to.
+
+Run from the repo root, against a server you don't mind writing to:
+    python -m benchmarks.bench_search --mongo-uri mongodb://localhost:27017 --docs 100000
+"""
+import statistics
+import argparse
+import asyncio
+import random
+import time
+import os
+import re
+
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+from pymongo import AsyncMongoClient  # noqa: E402
+from services.indexes import INDEXES  # noqa: E402
+from services.search import FORM_FIELDS, search_collection, search_terms  # noqa: E402
+
+FIRST_NAMES = ["Kwame", "Ama", "Kofi", "Akosua", "Yaw", "Adwoa", "Kwabena", "Abena", "Kojo", "Efua", "Ekow", "Esi"]
+LAST_NAMES = ["Mensah", "Owusu", "Boateng", "Asante", "Osei", "Agyeman", "Appiah", "Darko", "Addo", "Quaye"]
+PROFESSIONS = ["nursing", "software engineering", "accounting", "agriculture", "teaching", "pharmacy"]
+
+
+def make_form(i, rng):
+    name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {rng.choice(LAST_NAMES)}"
+    phone = f"0{rng.choice([20, 24, 26, 27, 50, 54, 55, 59])}{rng.randrange(10**7):07d}"
+    if i % 10 == 0:
+        form = {"full_name": name, "email": f"agent{i}@example.com", "phone": phone,
+                "profession": rng.choice(PROFESSIONS), "role": "agent"}
+    else:
+        form = {"trainee_name": name, "trainee_email": f"trainee{i}@example.com",
+                "trainee_phone_number": phone, "parent_name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                "role": "trainee"}
+    form["search_terms"] = search_terms(form, FORM_FIELDS)
+    return form
+
+
+async def seed(collection, count, rng):
+    await collection.drop()
+    batch = []
+    for i in range(count):
+        batch.append(make_form(i, rng))
+        if len(batch) == 5000:
+            await collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        await collection.insert_many(batch, ordered=False)
+    await collection.create_indexes(INDEXES["application_forms"])
+
+
+def queries(count, rng):
+    samples = []
+    for _ in range(count):
+        kind = rng.choice(["name", "prefix", "email", "phone"])
+        if kind == "name":
+            samples.append(f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}")
+        elif kind == "prefix":
+            samples.append(rng.choice(LAST_NAMES)[:3])
+        elif kind == "email":
+            samples.append(f"trainee{rng.randrange(count * 10)}@exam")
+        else:
+            samples.append(f"0{rng.choice([24, 54])}{rng.randrange(1000):03d}")
+    return samples
+
+
+async def scan(collection, query, limit):
+    # No search_terms: a case-insensitive substring match on every field
+    pattern = re.compile(re.escape(query), re.IGNORECASE)
+    return await collection.find(
+        {"$or": [{field: pattern} for field in FORM_FIELDS]}).limit(limit).to_list()
+
+
+async def timed(search, collection, samples, limit):
+    latencies = []
+    for query in samples:
+        start = time.perf_counter()
+        await search(collection, query, limit)
+        latencies.append((time.perf_counter() - start) * 1000)
+    cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+    return cuts[49], cuts[98]
+
+
+async def benchmark(args):
+    rng = random.Random(args.seed)
+    client = AsyncMongoClient(args.mongo_uri)
+    collection = client[args.database]["application_forms"]
+    if not args.skip_seed:
+        start = time.perf_counter()
+        await seed(collection, args.docs, rng)
+        print(f"seeded {args.docs} forms in {time.perf_counter() - start:.1f}s")
+
+    samples = queries(args.queries, rng)
+
+    async def indexed(collection, query, limit):
+        return await search_collection(collection, query, FORM_FIELDS, limit)
+
+    p50, p99 = await timed(indexed, collection, samples, args.limit)
+    print(f"search_terms + text   p50 {p50:8.2f}ms   p99 {p99:8.2f}ms")
+    p50, p99 = await timed(scan, collection, samples[:args.scan_queries], args.limit)
+    print(f"regex scan            p50 {p50:8.2f}ms   p99 {p99:8.2f}ms   ({args.scan_queries} queries)")
+
+    explain = await collection.find(
+        {"$and": [{"search_terms": re.compile("^mens")}]}).limit(args.limit).explain()
+    stats = explain["executionStats"]
+    print(f"'mens' examined {stats['totalKeysExamined']} keys and {stats['totalDocsExamined']} documents")
+    await client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mongo-uri", required=True)
+    parser.add_argument("--database", default="career_grooming_search_bench")
+    parser.add_argument("--docs", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--scan-queries", type=int, default=50, help="the scan is slow, time fewer of them")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--skip-seed", action="store_true", help="reuse the data from the last run")
+    asyncio.run(benchmark(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
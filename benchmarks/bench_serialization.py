@@ -0,0 +1,82 @@
+"""Compare the old serialize-then-encode path with MongoJSONResponse.
+
+Run from the repo root:
+    python -m benchmarks.bench_serialization --docs 5000
+"""
+from bson.objectid import ObjectId
+from datetime import datetime, timezone
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from utils import MongoJSONResponse
+import argparse
+import timeit
+
+
+# The helpers the routes used before MongoJSONResponse, kept here as the baseline
+def serialize_mongo_data(data):
+    if isinstance(data, list):
+        return [serialize_mongo_data(item) for item in data]
+    elif isinstance(data, dict):
+        return {
+            key: serialize_mongo_data(value)
+            for key, value in data.items()
+        }
+    elif isinstance(data, ObjectId):
+        return str(data)
+    else:
+        return data
+
+
+def replace_form_id(form):
+    form["id"] = str(form["_id"])
+    del form["_id"]
+    return form
+
+
+def make_documents(count):
+    return [{
+        "_id": ObjectId(),
+        "username": f"trainee{i}",
+        "email": f"trainee{i}@example.com",
+        "role": "trainee",
+        "agent_id": ObjectId(),
+        "created_at": datetime.now(tz=timezone.utc).replace(tzinfo=None),
+        "documents": {"ghana_card": f"https://res.cloudinary.com/demo/{i}.pdf", "checked": True},
+        "tags": ["nursing", "accra"],
+    } for i in range(count)]
+
+
+def legacy_recursive(documents):
+    # serialize_mongo_data, then FastAPI's jsonable_encoder and JSONResponse
+    content = jsonable_encoder({"users": serialize_mongo_data(documents)}, custom_encoder={ObjectId: str})
+    return JSONResponse(content).body
+
+
+def legacy_id_loop(documents):
+    # replace_form_id per item, then FastAPI's jsonable_encoder and JSONResponse
+    forms = [replace_form_id(dict(d)) for d in documents]
+    content = jsonable_encoder({"forms": forms}, custom_encoder={ObjectId: str})
+    return JSONResponse(content).body
+
+
+def mongo_json_response(documents):
+    return MongoJSONResponse({"items": documents}).body
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    documents = make_documents(args.docs)
+    print(f"{args.docs} documents, best of {args.repeat} runs")
+    for name, func in [("serialize_mongo_data", legacy_recursive),
+                       ("replace_form_id loop", legacy_id_loop),
+                       ("MongoJSONResponse", mongo_json_response)]:
+        best = min(timeit.repeat(lambda: func(documents), number=1, repeat=args.repeat))
+        print(f"{name:<22} {best * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Measure cold start: importing main and serving the first request.
+
+Every run is a fresh interpreter, so nothing is warm from a previous one.
+
+Run from the repo root:
+    python -m benchmarks.bench_startup --runs 5
+"""
+import statistics
+import subprocess
+import argparse
+import json
+import sys
+import os
+
+
+# Runs in the child interpreter and prints its timings as JSON
+# (httpx is only the test client here, so it is imported before the clock starts)
+CHILD = """
+import asyncio, sys, time, httpx
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+
+async def first_request():
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.app.router.lifespan_context(main.app):
+        started = time.perf_counter()
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            response = await client.get("/")
+            response.raise_for_status()
+        return started, time.perf_counter()
+
+started, served = asyncio.run(first_request())
+heavy = ["google.genai", "cloudinary", "cloudinary.uploader", "pymongo"]
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "lifespan_ms": (started - imported) * 1000,
+    "first_request_ms": (served - start) * 1000,
+    "loaded": {name: name in sys.modules for name in heavy},
+}))
+"""
+
+
+def run_once():
+    env = {
+        **os.environ,
+        "MONGO_URI": os.getenv("MONGO_URI", "mongodb://localhost:27017"),
+        "MONGO_ENSURE_INDEXES": "false",
+        # Measures the lazy path, nothing connects before the first request needs it
+        "WARM_CONNECTIONS": "false",
+        "JWT_SECRET_KEY": os.getenv("JWT_SECRET_KEY", "benchmark"),
+        "GOOGLE_API_KEY": os.getenv("GOOGLE_API_KEY", "benchmark"),
+    }
+    output = subprocess.run(
+        [sys.executable, "-c", "import json\n" + CHILD],
+        env=env, capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.runs)]
+    for key in ["import_ms", "lifespan_ms", "first_request_ms"]:
+        values = [run[key] for run in runs]
+        print(f"{key:<18} median {statistics.median(values):8.1f}   min {min(values):8.1f}   max {max(values):8.1f}")
+    print("loaded before the first request:",
+          ", ".join(f"{name}={loaded}" for name, loaded in runs[-1]["loaded"].items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""Throughput and latency benchmark for the API, with local stand-ins for every external service.
+
+Drives main.app in-process through httpx's ASGI transport. Mongo is
+mongomock by default or a local server via --mongo-uri. Cloudinary, SMTP
+and Gemini are replaced by fakes that sleep for the configured latency.
+
+    python -m benchmarks.load_test --requests 200 --concurrency 20 --output bench.json
+    python -m benchmarks.load_test --mongo-uri mongodb://localhost:27017 --upload-latency-ms 300
+
+Point --mongo-uri at a throwaway server, the run writes to career_grooming_db.
+mongomock has no $lookup sub-pipelines, so the agent overview only succeeds
+against a real server.
+"""
+from datetime import datetime, timezone
+import statistics
+import argparse
+import asyncio
+import json
+import time
+import os
+
+
+class FakeSMTP:
+    def __init__(self, latency):
+        self.latency = latency
+
+    def send_message(self, msg):
+        time.sleep(self.latency)
+
+    def quit(self):
+        pass
+
+
+class FakeGenAI:
+    """Stands in for genai.Client, only the calls AdviceService makes."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.aio = self
+        self.models = self
+
+    async def generate_content(self, model, contents):
+        await asyncio.sleep(self.latency)
+        return FakeGenAIResponse(f"Advice for: {contents}")
+
+    async def generate_content_stream(self, model, contents):
+        async def chunks():
+            for word in f"Advice for: {contents}".split():
+                await asyncio.sleep(self.latency / 10)
+                yield FakeGenAIResponse(word + " ")
+        return chunks()
+
+
+class FakeGenAIResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+def configure(args):
+    """Set env and patch external services, must run before main is imported."""
+    os.environ.update({
+        "JWT_SECRET_KEY": "benchmark-secret-key-benchmark-secret-key",
+        "JWT_ALGORITHM": "HS256",
+        "TRAINEE_PASSCODE": "trainee-passcode",
+        "AGENT_PASSCODE": "agent-passcode",
+        "BCRYPT_ROUNDS": str(args.bcrypt_rounds),
+        "SMTP_STARTTLS": "false",
+        "GOOGLE_API_KEY": os.getenv("GOOGLE_API_KEY", "benchmark"),
+    })
+    # Every request comes from one address and a handful of users, so the
+    # per-caller rate limits would turn the run into a 429 benchmark
+    for route_class in ["AUTH", "UPLOAD", "GENAI"]:
+        os.environ.setdefault(f"ADMISSION_{route_class}_RATE_PER_MINUTE", "0")
+    if args.mongo_uri:
+        os.environ["MONGO_URI"] = args.mongo_uri
+    else:
+        import mongomock
+        import pymongo
+        # mongomock only has a blocking client, so run the sync fallback
+        pymongo.MongoClient = mongomock.MongoClient
+        os.environ.update({"MONGO_URI": "mongodb://mongomock", "MONGO_MODE": "sync",
+                           "MONGO_ENSURE_INDEXES": "false"})
+
+    import cloudinary.uploader
+    upload_latency = args.upload_latency_ms / 1000
+
+    def fake_upload_large(file, **options):
+        time.sleep(upload_latency)
+        public_id = f"bench/{time.perf_counter_ns()}"
+        return {"public_id": public_id, "resource_type": "raw",
+                "secure_url": f"https://res.cloudinary.com/bench/{public_id}"}
+
+    cloudinary.uploader.upload_large = fake_upload_large
+    cloudinary.uploader.destroy = lambda public_id, **options: {"result": "ok"}
+
+    from services import mailer
+    smtp_latency = args.smtp_latency_ms / 1000
+    mailer.SMTPConnection._connect = lambda self: FakeSMTP(smtp_latency)
+
+
+async def seed(client, db):
+    """Create an admin, an agent and a trainee assigned to them, and return their tokens."""
+    from bson.objectid import ObjectId
+
+    await db.application_forms_collection.insert_one(
+        {"full_name": "Bench Agent", "email": "agent@bench.example.com", "profession": "nursing", "role": "agent"})
+    await db.application_forms_collection.insert_one(
+        {"trainee_name": "Bench Trainee", "trainee_email": "trainee@bench.example.com", "role": "trainee"})
+    accounts = [("admin@bench.example.com", "admin", "none"),
+                ("agent@bench.example.com", "agent", "agent-passcode"),
+                ("trainee@bench.example.com", "trainee", "trainee-passcode")]
+    tokens = {}
+    ids = {}
+    for email, role, passcode in accounts:
+        response = await client.post("/users/signup", data={
+            "username": role, "email": email, "password": "benchmark-password",
+            "confirm_password": "benchmark-password", "passcode": passcode, "role": role})
+        response.raise_for_status()
+        ids[role] = ObjectId(response.json()["user_id"])
+        response = await client.post("/users/login", data={"email": email, "password": "benchmark-password"})
+        response.raise_for_status()
+        tokens[role] = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    await db.users_collection.update_one(
+        {"_id": ids["trainee"]}, {"$set": {"agent_id": ids["agent"], "agent_name": "agent"}})
+    await db.users_collection.update_one(
+        {"_id": ids["agent"]}, {"$set": {"trainees_assigned": [ids["trainee"]]}})
+    for i in range(50):
+        await db.resources.insert_one({
+            "agent_id": ids["agent"], "trainee_id": ids["trainee"], "task_type": "resource",
+            "resource": f"https://res.cloudinary.com/bench/resource{i}.pdf", "status": "assigned"})
+    for i in range(500):
+        await db.application_forms_collection.insert_one({
+            "trainee_name": f"Applicant {i}", "trainee_email": f"applicant{i}@bench.example.com",
+            "trainee_gender": "female" if i % 2 else "male", "role": "trainee",
+            "created_at": datetime.now(tz=timezone.utc)})
+    return tokens
+
+
+def scenarios(tokens):
+    """name -> function building the i-th request as (method, url, httpx kwargs)."""
+    filler = b"0" * 200_000
+
+    def document(name, i):
+        # Distinct bytes per file, identical ones would be deduplicated instead of uploaded
+        return (f"{name}.pdf", b"%PDF-1.4 " + f"{name} {i}".encode() + filler, "application/pdf")
+    topics = ["nursing", "software engineering", "accounting", "agriculture"]
+    return {
+        "POST /users/signup": lambda i: ("POST", "/users/signup", {"data": {
+            "username": f"admin{i}", "email": f"admin{i}@bench.example.com", "password": "benchmark-password",
+            "confirm_password": "benchmark-password", "passcode": "none", "role": "admin"}}),
+        "POST /users/login": lambda i: ("POST", "/users/login", {"data": {
+            "email": "trainee@bench.example.com", "password": "benchmark-password"}}),
+        "POST /forms/trainee": lambda i: ("POST", "/forms/trainee", {
+            "data": {"trainee_name": f"Form {i}", "trainee_email": f"form{i}@bench.example.com",
+                     "trainee_phone_number": "0240000000", "parent_name": "Parent",
+                     "parent_contact": "0240000001", "parent_occupation": "Teacher"},
+            "files": {name: document(name, i) for name in
+                      ["trainee_ghana_card", "trainee_birth_cert", "trainee_wassce_cert", "parent_ghana_card"]}}),
+        "GET /admin/users": lambda i: ("GET", "/admin/users", {"headers": tokens["admin"]}),
+        "GET /admin/forms": lambda i: ("GET", "/admin/forms?limit=100", {"headers": tokens["admin"]}),
+        "POST /admin/send_verification_code": lambda i: ("POST", "/admin/send_verification_code", {
+            "headers": tokens["admin"], "data": {"email": f"applicant{i % 500}@bench.example.com"}}),
+        "GET /dashboard/agent/trainees": lambda i: ("GET", "/dashboard/agent/trainees", {"headers": tokens["agent"]}),
+        "GET /dashboard/agent/resources": lambda i: ("GET", "/dashboard/agent/resources", {"headers": tokens["agent"]}),
+        "GET /dashboard/agent/overview": lambda i: ("GET", "/dashboard/agent/overview", {"headers": tokens["agent"]}),
+        "GET /dashboard/trainee/resources": lambda i: ("GET", "/dashboard/trainee/resources", {"headers": tokens["trainee"]}),
+        "GET /dashboard/trainee/progress": lambda i: ("GET", "/dashboard/trainee/progress", {"headers": tokens["trainee"]}),
+        "POST /dashboard/trainee/genai/get_advice": lambda i: ("POST", "/dashboard/trainee/genai/get_advice", {
+            "headers": tokens["trainee"], "data": {"prompt": topics[i % len(topics)]}}),
+    }
+
+
+def summarize(latencies, statuses, elapsed):
+    latencies = sorted(latencies)
+    cuts = statistics.quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 else latencies * 99
+    errors = sum(not 200 <= status < 300 for status in statuses)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "statuses": {str(s): statuses.count(s) for s in sorted(set(statuses))},
+        "requests_per_second": round(len(latencies) / elapsed, 2),
+        "latency_ms": {
+            "p50": round(cuts[49] * 1000, 2),
+            "p90": round(cuts[89] * 1000, 2),
+            "p99": round(cuts[98] * 1000, 2),
+            "max": round(latencies[-1] * 1000, 2),
+        },
+    }
+
+
+async def run_scenario(client, build, requests, concurrency):
+    latencies = []
+    statuses = []
+    counter = iter(range(requests))
+
+    async def worker():
+        for i in counter:
+            method, url, kwargs = build(i)
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, url, **kwargs)
+                statuses.append(response.status_code)
+            except Exception:
+                statuses.append(599)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, statuses, time.perf_counter() - start)
+
+
+async def benchmark(args):
+    import httpx
+    import main
+    import db
+    from services.advice import AdviceService, get_advice_service
+
+    advice = AdviceService(client=FakeGenAI(args.genai_latency_ms / 1000))
+    main.app.dependency_overrides[get_advice_service] = lambda: advice
+
+    results = {}
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            tokens = await seed(client, db)
+            for name, build in scenarios(tokens).items():
+                if args.only and not any(part in name for part in args.only):
+                    continue
+                results[name] = await run_scenario(client, build, args.requests, args.concurrency)
+                summary = results[name]
+                print(f"{name:<45} {summary['requests_per_second']:>9.1f} req/s  "
+                      f"p50 {summary['latency_ms']['p50']:>8.1f}ms  p99 {summary['latency_ms']['p99']:>8.1f}ms  "
+                      f"errors {summary['errors']}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--mongo-uri", help="local MongoDB to use instead of mongomock")
+    parser.add_argument("--upload-latency-ms", type=float, default=200)
+    parser.add_argument("--smtp-latency-ms", type=float, default=100)
+    parser.add_argument("--genai-latency-ms", type=float, default=1500)
+    parser.add_argument("--bcrypt-rounds", type=int, default=int(os.getenv("BCRYPT_ROUNDS", "12")))
+    parser.add_argument("--only", nargs="*", help="run endpoints whose name contains any of these")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    configure(args)
+    results = asyncio.run(benchmark(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "run_at": datetime.now(tz=timezone.utc).isoformat(),
+                "config": {k: v for k, v in vars(args).items() if k != "output"},
+                "results": results,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
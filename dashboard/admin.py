@@ -1,162 +1,301 @@
-from db import users_collection, application_forms_collection
-from utils import replace_form_id, valid_id, two_valid_ids, serialize_mongo_data, serialize_user
-from fastapi import HTTPException, status, Depends, Form
+from db import users_collection, application_forms_collection, transcript_collection
+from utils import valid_id, two_valid_ids, MongoJSONResponse, build_projection, paginate, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from fastapi import HTTPException, status, Depends, Form, Query
 from bson.objectid import ObjectId
 from fastapi import APIRouter
-from dependencies.authn import is_authenticated
+from dependencies.authn import is_authenticated, invalidate_user, user_cache
 from dependencies.authz import has_roles
 from typing import Annotated
+from enum import Enum
 from email.message import EmailMessage
-from pydantic import EmailStr
-import smtplib
+from pydantic import BaseModel, EmailStr
+from routes.forms import Gender
+from routes.users import UserRole
+from services.passwords import pool_stats
+from services.mailer import queue_messages, get_job, mail_queue
+from services.assignments import AGENT_NOT_FOUND, TRAINEE_NOT_FOUND, assign_trainees, auto_assign
+from services.advice import advice_service
+from services.admission import admission_stats
+from services.uploads import release_assets, upload_stats
+from services import analytics
+from services.search import SEARCH_MAX_LIMIT, search_forms, search_users, reindex
+from services.versions import bump, trainees_scope
+from services.exports import EXPORT_BATCH_SIZE, EXPORT_MAX_BATCH_SIZE, csv_rows, ndjson_rows
+from fastapi.responses import StreamingResponse
+from datetime import datetime, timezone
 import os
 
 admin_router = APIRouter(tags=["Admin"])
 
+# Never sent back in user and form listings, secrets and internal bookkeeping
+SECRET_USER_FIELDS = ("password", "passcode", "search_terms")
+INTERNAL_FORM_FIELDS = ("search_terms", "asset_ids")
+
 trainee_code = os.getenv("TRAINEE_PASSCODE")
 agent_code = os.getenv("AGENT_PASSCODE")
 
 
-@admin_router.post("/admin/send_verification_code", dependencies=[Depends(has_roles("admin"))])
-def send_verification_code(email: Annotated[EmailStr, Form()]):
+def passcode_message(application):
+    msg = EmailMessage()
+    msg["Subject"] = "[Important] Verification Code"
+    if application["role"] == "trainee":
+        msg["To"] = application["trainee_email"]
+        msg.set_content(
+            f"Dear {application['trainee_name']},\nCongratulations {application['trainee_name']}!\n Use this passcode to signup {trainee_code}"
+        )
+    elif application["role"] == "agent":
+        msg["To"] = application["email"]
+        msg.set_content(
+            f"Dear {application['full_name']},\nCongratulation {application['full_name']}!\n Use this passcode to signup {agent_code}"
+        )
+    return msg
+
+
+@admin_router.post("/admin/send_verification_code", status_code=status.HTTP_202_ACCEPTED, dependencies=[Depends(has_roles("admin"))])
+async def send_verification_code(email: Annotated[EmailStr, Form()]):
     # Ensure application exist
-    user = application_forms_collection.find_one(
+    user = await application_forms_collection.find_one(
         filter={"$or": [{"trainee_email": email}, {"email": email}]})
-    print(user)
     if not user:
         raise HTTPException(status.HTTP_404_NOT_FOUND,
                             "Applicant does not exist!")
-    # elif not agent:
+    # Delivered in the background by the mail workers
+    job = await queue_messages([passcode_message(user)])
+    return {"message": "Passcode queued for delivery", "job_id": str(job["job_id"])}
 
-    #     raise HTTPException(status.HTTP_404_NOT_FOUND, "Applicant does not exist!")
-    # Create the email message
-    msg = EmailMessage()
-    msg["From"] = "noreply@example.com"
 
-    msg["Subject"] = "[Important] Verification Code"
-    if user["role"] == "trainee":
-        msg["To"] = user["trainee_email"]
-        msg.set_content(
-            f"Dear {user["trainee_name"]},\nCongratulations {user["trainee_name"]}!\n Use this passcode to signup {trainee_code}"
-        )
-    elif user["role"] == "agent":
-        msg["To"] = user["email"]
-        msg.set_content(
-            f"Dear {user["full_name"]},\nCongratulation {user["full_name"]}!\n Use this passcode to signup {agent_code}"
-        )
-    # Send password reset email
-    try:
-        with smtplib.SMTP(os.getenv("SMTP_HOST"), os.getenv("SMTP_PORT")) as server:
-            server.starttls()
-            server.login(os.getenv("SMTP_USERNAME"),
-                         os.getenv("SMTP_PASSWORD"))
-            server.send_message(msg=msg)
-        # Return reponse
-        return {"message": "Passcode sent successfully!"}
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_417_EXPECTATION_FAILED, detail=e)
+@admin_router.post("/admin/send_verification_codes", status_code=status.HTTP_202_ACCEPTED, dependencies=[Depends(has_roles("admin"))])
+async def send_verification_codes(emails: Annotated[list[EmailStr], Form()]):
+    emails = list(dict.fromkeys(emails))
+    applications = await application_forms_collection.find(
+        {"$or": [{"trainee_email": {"$in": emails}}, {"email": {"$in": emails}}]}).to_list()
+    messages = [passcode_message(application) for application in applications]
+    found = {msg["To"] for msg in messages}
+    job = await queue_messages(messages, not_found=[e for e in emails if e not in found])
+    return MongoJSONResponse(job, status_code=status.HTTP_202_ACCEPTED)
+
+
+@admin_router.get("/admin/email_jobs/{job_id}", dependencies=[Depends(has_roles("admin"))])
+async def get_email_job(job_id: str):
+    valid_id(job_id)
+    job = await get_job(ObjectId(job_id))
+    if not job:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Email job not found")
+    return MongoJSONResponse({"job": job})
+
+
+class AssignmentPair(BaseModel):
+    agent_id: str
+    trainee_id: str
 
 
 @admin_router.post("/admin/assign_agent/{agent_id}", dependencies=[Depends(has_roles("admin"))])
-def assign_trainee_to_agent(agent_id, trainee_id):
+async def assign_trainee_to_agent(agent_id, trainee_id):
     two_valid_ids(agent_id, trainee_id)
-    agent_found = users_collection.find_one(
-        {"_id": ObjectId(agent_id), "role": "agent"})
-    if not agent_found:
-        raise HTTPException(status.HTTP_404_NOT_FOUND,
-                            detail="Agent not found")
+    [result] = await assign_trainees([(agent_id, trainee_id)])
+    if result["status"] == "conflict":
+        raise HTTPException(status.HTTP_409_CONFLICT, detail=result["detail"])
+    if result["status"] == "rejected":
+        if result["reason"] in (AGENT_NOT_FOUND, TRAINEE_NOT_FOUND):
+            raise HTTPException(status.HTTP_404_NOT_FOUND, detail=result["detail"])
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, detail=result["detail"])
 
-    trainee_found = users_collection.find_one(
-        {"_id": ObjectId(trainee_id), "role": "trainee"})
-    if not trainee_found:
-        raise HTTPException(status.HTTP_404_NOT_FOUND,
-                            detail="Trainee not found")
+    return {"message": result["detail"]}
 
-    if trainee_found.get("agent_id") is not None:
-        raise HTTPException(
-            status.HTTP_400_BAD_REQUEST,
-            detail=f"Trainee '{trainee_found['username']}' is already assigned to an agent."
-        )
 
-    max_trainees = 5
+@admin_router.post("/admin/assign_agents", dependencies=[Depends(has_roles("admin"))])
+async def assign_trainees_to_agents(pairs: list[AssignmentPair]):
+    results = await assign_trainees([(pair.agent_id, pair.trainee_id) for pair in pairs])
+    return {
+        "assigned": sum(result["status"] == "assigned" for result in results),
+        "results": results
+    }
 
-    if len(agent_found.get("trainees_assigned", [])) >= max_trainees:
-        raise HTTPException(
-            status.HTTP_400_BAD_REQUEST,
-            detail=f"Agent '{agent_found['username']}' has reached the maximum assignment limit of {max_trainees}."
-        )
 
-    users_collection.update_one({
-        "_id": ObjectId(trainee_id),
-        "role": "trainee"},
-        {"$set": {
-            "agent_id": agent_found["_id"],
-            "agent_name": agent_found["username"],
-            "agent_email": agent_found["email"]
-        }})
-
-    users_collection.update_one(
-        {
-            "_id": ObjectId(agent_id),
-            "role": "trainee"},
-        {"$set": {
-            "trainee_id": trainee_found["_id"],
-            "trainee_name": trainee_found["username"],
-            "trainee_email": trainee_found["email"]
-        }}
-    )
-
-    return {"message": f"Agent '{agent_found["username"]}' has been assigned to '{trainee_found["username"]}'"}
+class AutoAssignRequest(BaseModel):
+    dry_run: bool = False
+    limit: int | None = None
+    # e.g. {"nursing": 2} to load nursing agents twice as fast, 0 to skip a profession
+    profession_weights: dict[str, float] = {}
+
+
+@admin_router.post("/admin/auto_assign", dependencies=[Depends(has_roles("admin"))])
+async def auto_assign_trainees(request: AutoAssignRequest):
+    summary = await auto_assign(request.dry_run, request.limit, request.profession_weights)
+    return MongoJSONResponse(summary)
 
 
 @admin_router.get("/admin/forms", dependencies=[Depends(has_roles("admin"))])
-def get_application_forms(user_id: Annotated[str, Depends(is_authenticated)]):
+async def get_application_forms(
+    user_id: Annotated[str, Depends(is_authenticated)],
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+    after: str | None = None,
+    role: UserRole | None = None,
+    gender: Gender | None = None,
+    fields: str | None = None
+):
     valid_id(user_id)
-    all_forms = application_forms_collection.find().to_list()
-    return {"forms": list(map(replace_form_id, all_forms))}
+    filter = {}
+    if role:
+        filter["role"] = role
+    if gender:
+        # Trainee forms store it as trainee_gender
+        filter["$or"] = [{"gender": gender}, {"trainee_gender": gender}]
+    return MongoJSONResponse(await paginate(application_forms_collection, filter, limit, after, build_projection(fields, INTERNAL_FORM_FIELDS)))
 
 
 @admin_router.delete("/admin/forms/{form_id}", dependencies=[Depends(has_roles("admin"))])
-def delete_form(form_id):
+async def delete_form(form_id):
     valid_id(form_id)
     # Delete form from database
-    delete_result = application_forms_collection.delete_one(
-        filter={"_id": ObjectId(form_id)})
-    if not delete_result:
-        raise HTTPException(
-            status.HTTP_422_UNPROCESSABLE_ENTITY, "Invalid mongo id received")
+    deleted_form = await application_forms_collection.find_one_and_delete(
+        filter={"_id": ObjectId(form_id)},
+        projection={"asset_ids": 1, "role": 1, "email": 1, "trainee_email": 1, "gender": 1, "trainee_gender": 1})
+    if not deleted_form:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Form not found")
+    await release_assets(deleted_form.get("asset_ids", []))
+    email = deleted_form.get("trainee_email") or deleted_form.get("email")
+    signed_up = email and await users_collection.find_one({"email": email}, projection={"_id": 1})
+    await analytics.application_deleted(
+        deleted_form["role"], deleted_form.get("trainee_gender") or deleted_form.get("gender"), bool(signed_up))
 
     return {"message": f"form with id {form_id} has been deleted successfully."}
 
 
 @admin_router.get("/admin/users", dependencies=[Depends(has_roles("admin"))])
-def get_users(user_id: Annotated[str, Depends(is_authenticated)]):
+async def get_users(
+    user_id: Annotated[str, Depends(is_authenticated)],
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+    after: str | None = None,
+    role: UserRole | None = None,
+    assigned: bool | None = None,
+    fields: str | None = None
+):
     valid_id(user_id)
-    all_users = list(users_collection.find())
-    serialized_users = serialize_mongo_data(all_users)
-
-    return {"users": serialized_users}
+    filter = {}
+    if role:
+        filter["role"] = role
+    if assigned is not None:
+        filter["agent_id"] = {"$ne": None} if assigned else None
+    return MongoJSONResponse(await paginate(users_collection, filter, limit, after, build_projection(fields, SECRET_USER_FIELDS)))
 
 
 @admin_router.get("/admin/users/{user_id}", dependencies=[Depends(has_roles("admin"))])
-def get_user_by_id(user_id: str):
+async def get_user_by_id(user_id: str):
     valid_id(user_id)
-    user = users_collection.find_one({"_id": ObjectId(user_id)})
+    user = await users_collection.find_one(
+        {"_id": ObjectId(user_id)}, projection=build_projection(None, SECRET_USER_FIELDS))
     if not user:
         raise HTTPException(status.HTTP_404_NOT_FOUND, detail="User not found")
-    return {"user": serialize_user(user)}
+    return MongoJSONResponse({"user": user})
 
 
 @admin_router.delete("/admin/users/{user_id}", dependencies=[Depends(has_roles("admin"))])
-def delete_user(user_id):
+async def delete_user(user_id):
     valid_id(user_id)
     # Delete user from database
-    delete_result = users_collection.delete_one(
-        filter={"_id": ObjectId(user_id)})
-    if not delete_result:
-        raise HTTPException(
-            status.HTTP_422_UNPROCESSABLE_ENTITY, "Invalid mongo id received")
+    deleted_user = await users_collection.find_one_and_delete(
+        filter={"_id": ObjectId(user_id)}, projection={"agent_id": 1, "role": 1, "email": 1})
+    if not deleted_user:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, detail="User not found")
+    await invalidate_user(user_id)
+    # Free the slot the trainee held with their agent
+    if deleted_user.get("agent_id"):
+        await users_collection.update_one(
+            {"_id": deleted_user["agent_id"]}, {"$pull": {"trainees_assigned": deleted_user["_id"]}})
+        await bump(trainees_scope(deleted_user["agent_id"]))
+    if deleted_user["role"] == "trainee":
+        transcript = await transcript_collection.find_one_and_delete(
+            {"trainee_id": deleted_user["_id"]}, projection={"asset_id": 1})
+        if transcript:
+            await release_assets([transcript.get("asset_id")])
+    application = await application_forms_collection.find_one(
+        {"$or": [{"email": deleted_user["email"]}, {"trainee_email": deleted_user["email"]}]},
+        projection={"_id": 1})
+    await analytics.user_deleted(deleted_user, has_application=bool(application))
 
     return {"message": f"user with id {user_id} has been deleted successfully."}
 
+
+
+@admin_router.get("/admin/stats", dependencies=[Depends(has_roles("admin"))])
+async def get_stats():
+    return {
+        "auth_cache": user_cache.stats(),
+        "password_hashing": pool_stats(),
+        "mail_queue_depth": mail_queue.qsize(),
+        "advice_cache": advice_service.stats(),
+        "admission": admission_stats(),
+        "uploads": await upload_stats(),
+    }
+
+
+class ExportDataset(str, Enum):
+    FORMS = "forms"
+    USERS = "users"
+    RESOURCES = "resources"
+    PROGRESS = "progress"
+
+
+class ExportFormat(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+
+@admin_router.get("/admin/export/{dataset}", dependencies=[Depends(has_roles("admin"))])
+async def export_dataset(
+    dataset: ExportDataset,
+    format: ExportFormat = ExportFormat.NDJSON,
+    role: UserRole | None = None,
+    batch_size: Annotated[int, Query(ge=1, le=EXPORT_MAX_BATCH_SIZE)] = EXPORT_BATCH_SIZE
+):
+    # Streamed from the cursor a batch at a time, for reporting jobs that want everything
+    filter = {}
+    if role and dataset in (ExportDataset.FORMS, ExportDataset.USERS):
+        filter["role"] = role
+    if format == ExportFormat.CSV:
+        rows, media_type = csv_rows(dataset.value, filter, batch_size), "text/csv"
+    else:
+        rows, media_type = ndjson_rows(dataset.value, filter, batch_size), "application/x-ndjson"
+    filename = f"{dataset.value}-{datetime.now(tz=timezone.utc):%Y%m%d}.{format.value}"
+    return StreamingResponse(rows, media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+class SearchScope(str, Enum):
+    ALL = "all"
+    FORMS = "forms"
+    USERS = "users"
+
+
+@admin_router.get("/admin/search", dependencies=[Depends(has_roles("admin"))])
+async def search(
+    q: Annotated[str, Query(min_length=2)],
+    scope: SearchScope = SearchScope.ALL,
+    role: UserRole | None = None,
+    limit: Annotated[int, Query(ge=1, le=SEARCH_MAX_LIMIT)] = 20
+):
+    # Names, emails, phone numbers and professions, best matches first
+    results = {}
+    if scope in (SearchScope.ALL, SearchScope.FORMS):
+        results["forms"] = await search_forms(q, limit, role)
+    if scope in (SearchScope.ALL, SearchScope.USERS):
+        results["users"] = await search_users(q, limit, role, SECRET_USER_FIELDS)
+    return MongoJSONResponse(results)
+
+
+@admin_router.post("/admin/search/reindex", dependencies=[Depends(has_roles("admin"))])
+async def reindex_search(full: bool = False):
+    # Backfills search terms for documents saved before search existed
+    return {"updated": await reindex(full)}
+
+
+@admin_router.get("/admin/analytics", dependencies=[Depends(has_roles("admin"))])
+async def get_analytics():
+    return MongoJSONResponse(analytics.report(await analytics.get_summary()))
+
+
+@admin_router.post("/admin/analytics/rebuild", dependencies=[Depends(has_roles("admin"))])
+async def rebuild_analytics():
+    # Recount everything, for when the counters look off
+    return MongoJSONResponse(analytics.report(await analytics.rebuild_summary()))
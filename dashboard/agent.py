@@ -1,42 +1,113 @@
-from db import transcript_collection, resources, users_collection
-from utils import two_valid_ids, valid_id
-from fastapi import Depends, Form, File
+from db import transcript_collection, resources, users_collection, progress_collection
+from utils import two_valid_ids, valid_id, MongoJSONResponse, build_projection, paginate, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from fastapi import Depends, Form, UploadFile, Query, Request
 from fastapi import APIRouter, HTTPException, status
 from dependencies.authn import is_authenticated
 from dependencies.authz import has_roles
 from typing import Annotated
 from bson.objectid import ObjectId
-import cloudinary.uploader
+from services.uploads import upload_files, release_assets
+from services.admission import admit_user
+from services.versions import (bump, cache_headers, listing_etag, not_modified, progress_scope,
+                               resources_scope, trainees_scope)
 
 
 agent_router = APIRouter(tags=["Agent Dashboard"])
 
 
 @agent_router.get("/dashboard/agent/trainees", dependencies=[Depends(has_roles(["agent", "admin"]))])
-def get_assigned_trainees(user_id: Annotated[str, Depends(is_authenticated)]):
+async def get_assigned_trainees(request: Request, user_id: Annotated[str, Depends(is_authenticated)]):
     valid_id(user_id)
-    assigned_trainees = list(users_collection.find({"agent_id": ObjectId(user_id)}))
-    for t in assigned_trainees:
-        t["_id"] = str(t["_id"])
-    return {"assigned_trainees": assigned_trainees}
+    etag = await listing_etag(request, trainees_scope(user_id))
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    assigned_trainees = await users_collection.find(
+        {"agent_id": ObjectId(user_id)}, projection={"password": 0, "passcode": 0, "search_terms": 0}).to_list()
+    return MongoJSONResponse({"assigned_trainees": assigned_trainees}, headers=cache_headers(etag))
 
-   
-@agent_router.get("/dashboard/agent/resources", dependencies=[Depends(has_roles(["agent", "admin"]))])
-def get_all_resources(user_id: Annotated[str, Depends(is_authenticated)]):
+
+@agent_router.get("/dashboard/agent/overview", dependencies=[Depends(has_roles(["agent", "admin"]))])
+async def get_overview(user_id: Annotated[str, Depends(is_authenticated)]):
+    # Trainees with their resources and transcript in one round trip
     valid_id(user_id)
-    all_resources = list(resources.find({}))
+    agent_id = ObjectId(user_id)
+    pipeline = [
+        {"$match": {"agent_id": agent_id, "role": "trainee"}},
+        {"$project": {"username": 1, "email": 1}},
+        {"$lookup": {
+            "from": "resources",
+            "localField": "_id",
+            "foreignField": "trainee_id",
+            "pipeline": [
+                {"$match": {"agent_id": agent_id}},
+                {"$project": {"resource": 1, "task_type": 1, "status": 1, "trainee_id": 1}},
+                {"$lookup": {
+                    "from": "progress",
+                    "let": {"trainee_id": "$trainee_id"},
+                    "localField": "_id",
+                    "foreignField": "resource_id",
+                    "pipeline": [
+                        {"$match": {"$expr": {"$eq": ["$trainee_id", "$$trainee_id"]}}},
+                        {"$project": {"_id": 0, "accessed_at": 1}}
+                    ],
+                    "as": "progress"
+                }},
+                {"$set": {
+                    "is_accessed": {"$gt": [{"$size": "$progress"}, 0]},
+                    "accessed_at": {"$first": "$progress.accessed_at"}
+                }},
+                {"$unset": ["progress", "trainee_id"]}
+            ],
+            "as": "resources"
+        }},
+        {"$lookup": {
+            "from": "transcript",
+            "localField": "_id",
+            "foreignField": "trainee_id",
+            "pipeline": [{"$project": {"_id": 0, "transcript_url": 1}}],
+            "as": "transcript"
+        }},
+        {"$set": {"transcript_url": {"$first": "$transcript.transcript_url"}}},
+        {"$unset": "transcript"}
+    ]
+    cursor = await users_collection.aggregate(pipeline)
+    return MongoJSONResponse({"trainees": await cursor.to_list()})
 
-    for resource in all_resources:
-        resource["_id"] = str(resource["_id"])
-    
-    return {"resources": all_resources}
+
+@agent_router.get("/dashboard/agent/resources", dependencies=[Depends(has_roles(["agent", "admin"]))])
+async def get_all_resources(
+    request: Request,
+    user_id: Annotated[str, Depends(is_authenticated)],
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+    after: str | None = None,
+    trainee_id: str | None = None,
+    task_type: str | None = None,
+    resource_status: Annotated[str | None, Query(alias="status")] = None,
+    fields: str | None = None
+):
+    valid_id(user_id)
+    etag = await listing_etag(request, resources_scope(user_id))
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    filter = {"agent_id": ObjectId(user_id)}
+    if trainee_id:
+        valid_id(trainee_id)
+        filter["trainee_id"] = ObjectId(trainee_id)
+    if task_type:
+        filter["task_type"] = task_type.lower()
+    if resource_status:
+        filter["status"] = resource_status
+    page = await paginate(resources, filter, limit, after, build_projection(fields, ("asset_id",)))
+    return MongoJSONResponse(page, headers=cache_headers(etag))
 
 
-@agent_router.post("/dashboard/agent/resource/assign", dependencies=[Depends(has_roles(["agent", "admin"]))])
-def assign_resource(
+@agent_router.post("/dashboard/agent/resource/assign", dependencies=[Depends(has_roles(["agent", "admin"])), Depends(admit_user("upload"))])
+async def assign_resource(
     user_id: Annotated[str, Depends(is_authenticated)],
     trainee_id: Annotated[str, Form(...)],
-    resource: Annotated[bytes, File()],
+    resource: UploadFile,
     task_type: Annotated[str, Form(...)]  
 ):
     two_valid_ids(trainee_id, user_id)
@@ -44,36 +115,60 @@ def assign_resource(
     if task_type.lower() not in ["quiz", "resource"]:
         raise HTTPException(status_code=400, detail="Invalid task type")
     
-    upload_resource = cloudinary.uploader.upload(resource)
+    uploads = await upload_files({"resource": resource})
 
     task_doc = {
         "agent_id": ObjectId(user_id),
         "trainee_id": ObjectId(trainee_id),
-        "resource": upload_resource["secure_url"],
+        "resource": uploads["resource"]["secure_url"],
+        "asset_id": uploads["resource"]["asset_id"],
         "task_type": task_type.lower(),
         "status": "assigned"
     }
 
-    resources.insert_one(task_doc)
+    await resources.insert_one(task_doc)
+    await bump(resources_scope(user_id), resources_scope(trainee_id))
     return {"message": f"{task_type.capitalize()} assigned successfully"}
 
 @agent_router.delete("/dashboard/agent/resource/remove", dependencies=[Depends(has_roles(["agent", "admin"]))])
-def remove_resource(
+async def remove_resource(
     user_id: Annotated[str, Depends(is_authenticated)],
     resource_id: Annotated[str, Form(...)]
 ):
     valid_id(resource_id)
-    task = resources.find_one({"_id": ObjectId(resource_id), "agent_id": ObjectId(user_id)})
+    task = await resources.find_one({"_id": ObjectId(resource_id), "agent_id": ObjectId(user_id)})
     if not task:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Task not found or unauthorized")
 
-    resources.delete_one({"_id": ObjectId(resource_id)})
+    await resources.delete_one({"_id": ObjectId(resource_id)})
+    await release_assets([task.get("asset_id")])
+    await progress_collection.delete_many(
+        {"trainee_id": task["trainee_id"], "resource_id": task["_id"]})
+    await bump(resources_scope(task["agent_id"]), resources_scope(task["trainee_id"]), progress_scope(task["agent_id"]), progress_scope(task["trainee_id"]))
     return {"message": "Task removed successfully"}
 
+@agent_router.get("/dashboard/agent/progress", dependencies=[Depends(has_roles(["agent", "admin"]))])
+async def get_trainees_progress(
+    request: Request,
+    user_id: Annotated[str, Depends(is_authenticated)],
+    trainee_id: str | None = None
+):
+    valid_id(user_id)
+    etag = await listing_etag(request, progress_scope(user_id))
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    filter = {"agent_id": ObjectId(user_id)}
+    if trainee_id:
+        valid_id(trainee_id)
+        filter["trainee_id"] = ObjectId(trainee_id)
+    progress = await progress_collection.find(filter, projection={"_id": 0}).to_list()
+    return MongoJSONResponse({"progress": progress}, headers=cache_headers(etag))
+
 @agent_router.get("/dashboard/agent/transcript/{trainee_id}", dependencies=[Depends(has_roles(["agent", "admin"]))])
-def get_transcript(trainee_id: str, user_id: Annotated[str, Depends(is_authenticated)]):
+async def get_transcript(trainee_id: str, user_id: Annotated[str, Depends(is_authenticated)]):
     two_valid_ids(trainee_id, user_id)
-    transcript = transcript_collection.find_one({"trainee_id": ObjectId(trainee_id)})
+    transcript = await transcript_collection.find_one({"trainee_id": ObjectId(trainee_id)})
     if not transcript:
         raise HTTPException(status_code=404, detail="Transcript not found")
     return {"transcript_url": transcript["transcript_url"]}
\ No newline at end of file
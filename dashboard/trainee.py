@@ -1,79 +1,161 @@
-from db import transcript_collection, resources
-from utils import replace_form_id, two_valid_ids, valid_id
-from fastapi import Depends, File, Form
-from fastapi import APIRouter
+from db import transcript_collection, resources, progress_collection
+from utils import two_valid_ids, valid_id, MongoJSONResponse, build_projection, paginate, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from fastapi import Depends, UploadFile, Form, Query, Request
+from fastapi import APIRouter, HTTPException, status
+from fastapi.responses import StreamingResponse
 from dependencies.authn import is_authenticated
 from dependencies.authz import has_roles
 from typing import Annotated
 from bson.objectid import ObjectId
-import cloudinary.uploader
-from utils import genai_client
+from pymongo.errors import DuplicateKeyError
+from datetime import datetime, timezone
+from services.uploads import upload_files, release_assets
+from services.admission import admit_user
+from services.advice import AdviceService, get_advice_service
+from services.versions import bump, cache_headers, listing_etag, not_modified, progress_scope, resources_scope
+import logging
 
 
+logger = logging.getLogger(__name__)
+
 trainee_router = APIRouter(tags=["Trainee Dashboard"])
 
 
 @trainee_router.post("/dashboard/trainee/progress", dependencies=[Depends(has_roles("trainee"))])
-def mark_progress(user_id: Annotated[str, Depends(is_authenticated)], resource_id, is_accessed: Annotated[bool, Form()]):
+async def mark_progress(user_id: Annotated[str, Depends(is_authenticated)], resource_id, is_accessed: Annotated[bool, Form()]):
     two_valid_ids(resource_id, user_id)
-
-    existing_progress = resources.find_one({
-        "user_id": ObjectId(user_id),
-        "_id": ObjectId(resource_id),
-        "is_accessed": is_accessed})
-
-    if is_accessed:
-        if existing_progress:
-            return {"message": "Already made progress"}
-        else:
-            resources.insert_one({
-                "user_id": user_id,
-                "is_accessed": True
-            })
-    else:
+    if not is_accessed:
         return {"message": "Resource not accessed yet"}
 
+    resource = await resources.find_one(
+        {"_id": ObjectId(resource_id), "trainee_id": ObjectId(user_id)}, projection={"agent_id": 1})
+    if not resource:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Resource not found")
+
+    # One progress document per (trainee, resource), repeat calls are no-ops
+    try:
+        result = await progress_collection.update_one(
+            {"trainee_id": ObjectId(user_id), "resource_id": ObjectId(resource_id)},
+            {"$setOnInsert": {
+                "agent_id": resource["agent_id"],
+                "is_accessed": True,
+                "accessed_at": datetime.now(tz=timezone.utc)
+            }},
+            upsert=True)
+    except DuplicateKeyError:
+        return {"message": "Already made progress"}
+    if result.upserted_id is None:
+        return {"message": "Already made progress"}
+    await bump(progress_scope(user_id), progress_scope(resource["agent_id"]))
+    return {"message": "Progress recorded"}
+
+
+@trainee_router.get("/dashboard/trainee/progress", dependencies=[Depends(has_roles("trainee"))])
+async def get_all_progress(request: Request, user_id: Annotated[str, Depends(is_authenticated)]):
+    valid_id(user_id)
+    etag = await listing_etag(request, progress_scope(user_id))
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    progress = await progress_collection.find(
+        {"trainee_id": ObjectId(user_id)}, projection={"_id": 0}).to_list()
+    return MongoJSONResponse({"progress": progress}, headers=cache_headers(etag))
+
 
 @trainee_router.get("/dashboard/trainee/progress/{resource_id}", dependencies=[Depends(has_roles(["trainee", "agent"]))])
-def get_progress(resource_id, user_id: Annotated[str, Depends(is_authenticated)]):
+async def get_progress(resource_id, user_id: Annotated[str, Depends(is_authenticated)]):
     two_valid_ids(resource_id, user_id)
-    progress = resources.find_one({
-        "_id": ObjectId(resource_id), 
-        "user_id": ObjectId(user_id),
+    # Trainees see their own progress, agents the progress of their trainees
+    progress = await progress_collection.find_one({
+        "resource_id": ObjectId(resource_id),
+        "$or": [{"trainee_id": ObjectId(user_id)}, {"agent_id": ObjectId(user_id)}]
     })
-    progress_made = progress["is_accessed"]
-    if progress_made:
+    if progress and progress["is_accessed"]:
         return {"message": f"Has made progress on the resource with id '{resource_id}'"}
     else:
         return {"message": "No progress made yet"}
-    
 
 
 @trainee_router.get("/dashboard/trainee/resources", dependencies=[Depends(has_roles(["trainee", "admin"]))])
-def get_resources(user_id: Annotated[str, Depends(is_authenticated)]):
+async def get_resources(
+    request: Request,
+    user_id: Annotated[str, Depends(is_authenticated)],
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+    after: str | None = None,
+    task_type: str | None = None,
+    resource_status: Annotated[str | None, Query(alias="status")] = None,
+    fields: str | None = None
+):
     valid_id(user_id)
-    resource = resources.find().to_list()
-    return {"forms": list(map(replace_form_id, resource))}
+    etag = await listing_etag(request, resources_scope(user_id))
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    filter = {"trainee_id": ObjectId(user_id)}
+    if task_type:
+        filter["task_type"] = task_type.lower()
+    if resource_status:
+        filter["status"] = resource_status
+    page = await paginate(resources, filter, limit, after, build_projection(fields, ("asset_id",)))
+    return MongoJSONResponse(page, headers=cache_headers(etag))
 
 
-@trainee_router.post("/dashboard/trainee/transcript", dependencies=[Depends(has_roles("trainee"))])
-def upload_transcript(
+@trainee_router.post("/dashboard/trainee/transcript", dependencies=[Depends(has_roles("trainee")), Depends(admit_user("upload"))])
+async def upload_transcript(
     user_id: Annotated[str, Depends(is_authenticated)],
-    transcript: Annotated[bytes, File()]
+    transcript: UploadFile
 ):
     valid_id(user_id)
-    upload_result = cloudinary.uploader.upload(transcript)
-    transcript_collection.insert_one({
-        "transcript": upload_result["secure_url"]})
+    uploads = await upload_files({"transcript": transcript})
+    # One transcript per trainee, uploading again replaces it
+    filter = {"trainee_id": ObjectId(user_id)}
+    update = {"$set": {
+        "transcript_url": uploads["transcript"]["secure_url"],
+        "asset_id": uploads["transcript"]["asset_id"]
+    }}
+    try:
+        previous = await transcript_collection.find_one_and_update(
+            filter, update, upsert=True, projection={"asset_id": 1})
+    except DuplicateKeyError:
+        # A concurrent first upload inserted the document, replace that one
+        previous = await transcript_collection.find_one_and_update(
+            filter, update, projection={"asset_id": 1})
+    if previous:
+        await release_assets([previous.get("asset_id")])
     return {"message": "Transcript uploaded successfully"}
 
 
-@trainee_router.post("/dashboard/trainee/genai/get_advice", dependencies=[Depends(is_authenticated)])
-def course_advice(prompt: Annotated[str, Form()]):
-    response = genai_client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=f"Based on the topic {prompt}, provide a detail to what the course is about and job availabilty in Ghana."
-    )
+@trainee_router.post("/dashboard/trainee/genai/get_advice", dependencies=[Depends(admit_user("genai"))])
+async def course_advice(
+    prompt: Annotated[str, Form()],
+    advice: Annotated[AdviceService, Depends(get_advice_service)]
+):
     return {
-        "content": response.text
-    }
\ No newline at end of file
+        "content": await advice.get_advice(prompt)
+    }
+
+
+def sse_event(data, event=None):
+    # Multi-line data is sent as one data field per line, as SSE requires
+    lines = [f"event: {event}"] if event else []
+    lines += [f"data: {line}" for line in data.split("\n")]
+    return "\n".join(lines) + "\n\n"
+
+
+@trainee_router.post("/dashboard/trainee/genai/get_advice/stream", dependencies=[Depends(admit_user("genai"))])
+async def course_advice_stream(
+    prompt: Annotated[str, Form()],
+    advice: Annotated[AdviceService, Depends(get_advice_service)]
+):
+    async def events():
+        try:
+            async for text in advice.stream_advice(prompt):
+                yield sse_event(text)
+        except Exception:
+            logger.exception("Advice stream failed")
+            yield sse_event("Could not generate advice, please try again", event="error")
+            return
+        yield sse_event("", event="done")
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -1,21 +1,192 @@
-from pymongo import MongoClient
+from pymongo import AsyncMongoClient, MongoClient
+from starlette.concurrency import run_in_threadpool
+from anyio import from_thread
+from services.metrics import CommandMetrics
 import os
 from dotenv import load_dotenv
 
 
 load_dotenv()
 
-#Connect to Mongo Atlas Cluster
-mongo_client = MongoClient(os.getenv("MONGO_URI"))
+# "async" uses pymongo's native AsyncMongoClient, "sync" falls back to the
+# blocking MongoClient with every call pushed onto the threadpool
+MONGO_MODE = os.getenv("MONGO_MODE", "async").lower()
 
 
-# Access database
-career_grooming_db = mongo_client["career_grooming_db"]
+def client_options():
+    write_concern = os.getenv("MONGO_WRITE_CONCERN", "majority")
+    options = {
+        "maxPoolSize": int(os.getenv("MONGO_MAX_POOL_SIZE", "100")),
+        "minPoolSize": int(os.getenv("MONGO_MIN_POOL_SIZE", "0")),
+        "maxIdleTimeMS": int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "60000")),
+        "connectTimeoutMS": int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "10000")),
+        "serverSelectionTimeoutMS": int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "10000")),
+        "waitQueueTimeoutMS": int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "10000")),
+        "w": int(write_concern) if write_concern.isdigit() else write_concern,
+        "event_listeners": [CommandMetrics()],
+    }
+    if os.getenv("MONGO_SOCKET_TIMEOUT_MS"):
+        options["socketTimeoutMS"] = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS"))
+    return options
+
+
+def _take(cursor, length):
+    documents = []
+    for document in cursor:
+        documents.append(document)
+        if length and len(documents) >= length:
+            break
+    return documents
+
+
+class ThreadedCursor:
+    """Awaitable wrapper around a blocking cursor, used in sync mode."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._buffer = []
+
+    def __getattr__(self, name):
+        # sort/limit/skip/batch_size return the cursor itself, so keep it wrapped
+        method = getattr(self._cursor, name)
+
+        def chained(*args, **kwargs):
+            method(*args, **kwargs)
+            return self
+        return chained
+
+    async def to_list(self, length=None):
+        return await run_in_threadpool(_take, self._cursor, length)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._buffer:
+            self._buffer = await run_in_threadpool(_take, self._cursor, 100)
+            self._buffer.reverse()
+        if not self._buffer:
+            raise StopAsyncIteration
+        return self._buffer.pop()
+
+
+class ThreadedCollection:
+    """Gives a blocking collection the same awaitable API as AsyncCollection."""
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def find(self, *args, **kwargs):
+        return ThreadedCursor(self._collection.find(*args, **kwargs))
+
+    async def aggregate(self, *args, **kwargs):
+        cursor = await run_in_threadpool(self._collection.aggregate, *args, **kwargs)
+        return ThreadedCursor(cursor)
+
+    def __getattr__(self, name):
+        attribute = getattr(self._collection, name)
+        if not callable(attribute):
+            return attribute
+
+        async def threaded(*args, **kwargs):
+            return await run_in_threadpool(attribute, *args, **kwargs)
+        return threaded
+
+
+_client = None
+_client_pid = None
+_lazy_collections = []
+
+
+def _forget_client():
+    global _client
+    _client = None
+    for collection in _lazy_collections:
+        collection._collection = None
+
+
+def get_client():
+    """The Mongo client, created on first use.
+
+    Building it resolves the mongodb+srv record and starts the monitor
+    threads, so it is left out of import time.
+    """
+    global _client, _client_pid
+    if _client is not None and _client_pid != os.getpid():
+        # Inherited across a fork, its sockets and monitor threads belong to the parent
+        _forget_client()
+    if _client is None:
+        #Connect to Mongo Atlas Cluster
+        client_class = MongoClient if MONGO_MODE == "sync" else AsyncMongoClient
+        _client = client_class(os.getenv("MONGO_URI"), **client_options())
+        _client_pid = os.getpid()
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is None:
+        return
+    client = _client
+    _forget_client()
+    if MONGO_MODE == "sync":
+        await run_in_threadpool(client.close)
+    else:
+        await client.close()
+
+
+async def ping():
+    admin = get_client().admin
+    if MONGO_MODE == "sync":
+        await run_in_threadpool(admin.command, "ping")
+    else:
+        await admin.command("ping")
+
+
+def get_database():
+    return get_client()["career_grooming_db"]
+
+
+class LazyCollection:
+    """Stands in for a collection until the client is first needed."""
+
+    def __init__(self, name):
+        self._name = name
+        self._collection = None
+        _lazy_collections.append(self)
+
+    def __getattr__(self, attr):
+        if self._collection is None:
+            collection = get_database()[self._name]
+            self._collection = ThreadedCollection(collection) if MONGO_MODE == "sync" else collection
+        return getattr(self._collection, attr)
+
+
+def get_collection(name):
+    return LazyCollection(name)
 
 
 # Pick a connection to operate on
-application_forms_collection = career_grooming_db["application_forms"]
-users_collection = career_grooming_db["users"]
-transcript_collection = career_grooming_db["transcript"]
-resources = career_grooming_db["resources"]
+application_forms_collection = get_collection("application_forms")
+users_collection = get_collection("users")
+transcript_collection = get_collection("transcript")
+resources = get_collection("resources")
+progress_collection = get_collection("progress")
+
+
+async def with_transaction(callback):
+    """Run `callback(session)` in a transaction, committed if it returns and aborted if it raises.
+
+    The driver's with_transaction reruns the callback on TransientTransactionError
+    (e.g. a write conflict with a concurrent transaction) and retries a commit
+    whose outcome is unknown, for up to two minutes.
+    """
+    if MONGO_MODE == "sync":
+        def transact():
+            with get_client().start_session() as session:
+                # The callback is async, run it back on the event loop from this worker thread
+                return session.with_transaction(lambda s: from_thread.run(callback, s))
+        return await run_in_threadpool(transact)
 
+    async with get_client().start_session() as session:
+        return await session.with_transaction(callback)
@@ -6,9 +6,26 @@ import jwt
 from db import users_collection
 from utils import replace_user_id
 from bson.objectid import ObjectId
+from services.cache import TTLCache
+from services import versions
+import time
 
 
-def is_authenticated(
+# Only what authorization needs, never the password hash or passcode
+PRINCIPAL_FIELDS = {"username": 1, "email": 1, "role": 1}
+
+user_cache = TTLCache(
+    maxsize=int(os.getenv("AUTH_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("AUTH_CACHE_TTL_SECONDS", "60")))
+# Deletes reach other workers' caches through the versions change stream.
+# While it isn't running, e.g. without a replica set or in sync mode, a
+# cached user is only trusted this long.
+AUTH_CACHE_UNWATCHED_TTL_SECONDS = float(os.getenv("AUTH_CACHE_UNWATCHED_TTL_SECONDS", "5"))
+
+
+# FastAPI caches dependency results for the lifetime of a request, so when
+# has_roles and the handler both depend on these they still run only once.
+async def is_authenticated(
     authorization: Annotated[HTTPAuthorizationCredentials, Depends(HTTPBearer())],
 ):
     try:
@@ -22,11 +39,36 @@ def is_authenticated(
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=str(e))
 
 
-def authenticated_user(user_id: Annotated[str, Depends(is_authenticated)]):
-    user = users_collection.find_one(filter={"_id": ObjectId(user_id)})
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Authenticated user missing from database!",
-        )
-    return replace_user_id(user)
\ No newline at end of file
+async def authenticated_user(user_id: Annotated[str, Depends(is_authenticated)]):
+    user = None
+    cached = user_cache.get(user_id)
+    if cached is not None:
+        cached_at, user = cached
+        if not versions.is_watching() and time.monotonic() - cached_at > AUTH_CACHE_UNWATCHED_TTL_SECONDS:
+            user = None
+    if user is None:
+        user = await users_collection.find_one(
+            filter={"_id": ObjectId(user_id)}, projection=PRINCIPAL_FIELDS)
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Authenticated user missing from database!",
+            )
+        user = replace_user_id(user)
+        user_cache.set(user_id, (time.monotonic(), user))
+    return dict(user)
+
+
+async def invalidate_user(user_id):
+    user_cache.pop(str(user_id))
+    await versions.bump(versions.user_scope(user_id))
+
+
+def _forget(scope):
+    if scope is None:
+        user_cache.clear()
+    elif scope.startswith("user:"):
+        user_cache.pop(scope.removeprefix("user:"))
+
+
+versions.on_change(_forget)
@@ -3,10 +3,11 @@ from fastapi import Depends, HTTPException, status
 from typing import Annotated
 
 def has_roles(roles):
-    def check_roles(
+    async def check_roles(
             user: Annotated[any, Depends(authenticated_user)]
     ):
         if user["role"] not in roles:
             raise HTTPException(status.HTTP_403_FORBIDDEN,
                                 "Access denied!")
+        return user
     return check_roles
\ No newline at end of file
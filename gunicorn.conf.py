@@ -0,0 +1,39 @@
+"""Multi-worker server settings, run from the repo root with
+
+    gunicorn -c gunicorn.conf.py main:app
+
+The app is imported once in the master and forked into one uvicorn
+worker per core. Importing creates no clients; each worker opens its own
+MongoDB, Gemini, Cloudinary and SMTP connections in the app's lifespan.
+"""
+import multiprocessing
+import tempfile
+import shutil
+import os
+
+bind = os.getenv("BIND", f"0.0.0.0:{os.getenv('PORT', '8000')}")
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+worker_class = "uvicorn_worker.UvicornWorker"
+# Every worker starts its own bcrypt process pool, share the cores out rather than each taking all of them
+os.environ.setdefault("PASSWORD_HASH_WORKERS", str(max(1, multiprocessing.cpu_count() // workers)))
+preload_app = os.getenv("PRELOAD_APP", "true").lower() != "false"
+# Long enough for queued emails to go out and in-flight uploads to finish
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+timeout = int(os.getenv("WORKER_TIMEOUT", "60"))
+keepalive = int(os.getenv("KEEPALIVE", "5"))
+# Trust X-Forwarded-For from these, admission control limits by client IP
+forwarded_allow_ips = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")
+
+# Each worker keeps its own metrics, they're merged through files on every scrape.
+# This has to be set before prometheus_client is imported, and emptied of the last run.
+if workers > 1:
+    os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "career-grooming-metrics"))
+if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+    shutil.rmtree(os.environ["PROMETHEUS_MULTIPROC_DIR"], ignore_errors=True)
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"])
+
+
+def child_exit(server, worker):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -1,27 +1,56 @@
 from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from services.passwords import shutdown_pool
+from services import analytics, lifecycle, mailer, versions
 from routes.users import users_router
 from dashboard.admin import admin_router
 from routes.forms import application_form_router
 from dashboard.trainee import trainee_router
 from dashboard.agent import agent_router
-import cloudinary
-import os
+from services.uploads import UploadSizeLimitMiddleware
+from services.metrics import MetricsMiddleware, metrics_response
+from utils import MongoJSONResponse
+from fastapi import status
 
-cloudinary.config(
-    cloud_name = os.getenv("CLOUD_NAME"),
-    api_key = os.getenv("API_KEY"),
-    api_secret = os.getenv("API_SECRET"),
-    )
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Runs in each worker after the server forks, so no client is shared between processes
+    mailer.start_workers()
+    await lifecycle.open_resources()
+    await lifecycle.ensure_indexes_once()
+    versions.start_watcher()
+    analytics.start_rebuilder()
+    yield
+    await analytics.stop_rebuilder()
+    await versions.stop_watcher()
+    await mailer.stop_workers()
+    shutdown_pool()
+    await lifecycle.close_resources()
 
-app = FastAPI(title="A Career Grooming Agency Platform API")
+
+app = FastAPI(title="A Career Grooming Agency Platform API", lifespan=lifespan,
+              default_response_class=MongoJSONResponse)
+app.add_middleware(UploadSizeLimitMiddleware)
+# Added last so it wraps everything, including requests rejected by the size limit
+app.add_middleware(MetricsMiddleware)
 
 @app.get("/")
-def get_home():
+async def get_home():
     return {
         "status": "ok",
         "message": "Welcome to Career Grooming Agency"
     }
 
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return metrics_response()
+
+@app.get("/ready", include_in_schema=False)
+async def get_ready():
+    # For load balancer health checks: 503 until this worker's MongoDB connection is up
+    ready, report = await lifecycle.readiness()
+    return MongoJSONResponse(report, status_code=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE)
+
 app.include_router(users_router)
 app.include_router(admin_router)
 app.include_router(application_form_router)
@@ -1,10 +1,14 @@
-from fastapi import APIRouter, Form, File
+from fastapi import APIRouter, Depends, Form, UploadFile
 from db import  application_forms_collection, users_collection
 from fastapi import HTTPException, status
 from pydantic import EmailStr
 from typing import Annotated
 from enum import Enum
-import cloudinary.uploader
+from pymongo.errors import DuplicateKeyError
+from services.uploads import upload_files, discard_uploads
+from services.admission import admit_ip
+from services import analytics
+from services.search import FORM_FIELDS, search_terms
 
 application_form_router = APIRouter(tags=["Forms"])
 
@@ -13,67 +17,75 @@ class Gender(str, Enum):
     MALE = "male"
     FEMALE = "female"
 
-@application_form_router.post("/forms/trainee")
-def register_trainee(
+@application_form_router.post("/forms/trainee", dependencies=[Depends(admit_ip("upload"))])
+async def register_trainee(
     trainee_name: Annotated[str, Form()],
     trainee_email: Annotated[EmailStr, Form()],
     trainee_phone_number: Annotated[str, Form()],
     parent_name: Annotated[str, Form()],
     parent_contact: Annotated[str, Form()],
     parent_occupation: Annotated[str, Form()],
-    trainee_ghana_card: Annotated[bytes, File()],
-    trainee_birth_cert: Annotated[bytes, File()],
-    trainee_wassce_cert: Annotated[bytes, File()],
-    parent_ghana_card: Annotated[bytes, File()],
+    trainee_ghana_card: UploadFile,
+    trainee_birth_cert: UploadFile,
+    trainee_wassce_cert: UploadFile,
+    parent_ghana_card: UploadFile,
     trainee_gender: Annotated[Gender, Form()] = Gender.MALE
 ):
-    # Check if trainee already exists
-    if application_forms_collection.find_one({"trainee_email": trainee_email}):
-        raise HTTPException(status.HTTP_400_BAD_REQUEST, detail="Trainee already registered!")
-
-    upload_result1 = cloudinary.uploader.upload(trainee_ghana_card)
-    upload_result2 = cloudinary.uploader.upload(trainee_birth_cert)
-    upload_result3 = cloudinary.uploader.upload(trainee_wassce_cert)
-    upload_result4 = cloudinary.uploader.upload(parent_ghana_card)
-
+    uploads = await upload_files({
+        "trainee_ghana_card": trainee_ghana_card,
+        "trainee_birth_cert": trainee_birth_cert,
+        "trainee_wassce_cert": trainee_wassce_cert,
+        "parent_ghana_card": parent_ghana_card,
+    })
 
     # Create trainee document
     trainee = {
         "trainee_name": trainee_name,
         "trainee_email": trainee_email,
         "trainee_phone_number": trainee_phone_number,
-        "trainee_ghana_card": upload_result1["secure_url"],
-        "trainee_birth_cert": upload_result2["secure_url"],
+        "trainee_ghana_card": uploads["trainee_ghana_card"]["secure_url"],
+        "trainee_birth_cert": uploads["trainee_birth_cert"]["secure_url"],
         "trainee_gender": trainee_gender,
-        "trainee_wassce_cert": upload_result3["secure_url"],
+        "trainee_wassce_cert": uploads["trainee_wassce_cert"]["secure_url"],
         "parent_name": parent_name,
         "parent_contact": parent_contact,
         "parent_occupation": parent_occupation,
-        "parent_ghana_card":upload_result4["secure_url"],
+        "parent_ghana_card": uploads["parent_ghana_card"]["secure_url"],
+        "asset_ids": [upload["asset_id"] for upload in uploads.values()],
         "role": "trainee"
     }
+    trainee["search_terms"] = search_terms(trainee, FORM_FIELDS)
 
-    application_forms_collection.insert_one(trainee)
+    # The unique index on trainee_email rejects duplicate applications
+    try:
+        await application_forms_collection.insert_one(trainee)
+    except DuplicateKeyError:
+        await discard_uploads(uploads.values())
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, detail="Trainee already registered!")
+    except Exception:
+        await discard_uploads(uploads.values())
+        raise
+    await analytics.application_submitted("trainee", trainee_gender.value)
     return {"message": "Trainee registered successfully!"}
 
 
-@application_form_router.post("/forms/agent")
-def register_agent(
+@application_form_router.post("/forms/agent", dependencies=[Depends(admit_ip("upload"))])
+async def register_agent(
     full_name: Annotated[str, Form()],
     email: Annotated[EmailStr, Form()],
     phone_number: Annotated[str, Form()],
     profession: Annotated[str, Form()],
     years_of_experience: Annotated[str, Form()],
-    certificate: Annotated[bytes, File()],
-    ghana_card: Annotated[bytes, File()],
+    certificate: UploadFile,
+    ghana_card: UploadFile,
     gender: Annotated[Gender, Form()] = Gender.MALE
 ):
-    # Check if agent already exists
-    if application_forms_collection.find_one({"email": email}) or users_collection.find_one({"email": email}):
+    # Check if agent already has an account, duplicate applications are
+    # rejected by the unique index on email
+    if await users_collection.find_one({"email": email}, projection={"_id": 1}):
         raise HTTPException(status.HTTP_400_BAD_REQUEST, detail="Agent already registered!")
 
-    upload_result1 = cloudinary.uploader.upload(certificate)
-    upload_result2 = cloudinary.uploader.upload(ghana_card)
+    uploads = await upload_files({"certificate": certificate, "ghana_card": ghana_card})
 
     # Create agent document
     agent = {
@@ -83,10 +95,20 @@ def register_agent(
         "profession": profession,
         "years_of_experience": years_of_experience,
         "gender": gender,
-        "ghana_card": upload_result1["secure_url"],
-        "certificate": upload_result2["secure_url"],
+        "ghana_card": uploads["ghana_card"]["secure_url"],
+        "certificate": uploads["certificate"]["secure_url"],
+        "asset_ids": [upload["asset_id"] for upload in uploads.values()],
         "role": "agent"
     }
+    agent["search_terms"] = search_terms(agent, FORM_FIELDS)
 
-    application_forms_collection.insert_one(agent)
+    try:
+        await application_forms_collection.insert_one(agent)
+    except DuplicateKeyError:
+        await discard_uploads(uploads.values())
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, detail="Agent already registered!")
+    except Exception:
+        await discard_uploads(uploads.values())
+        raise
+    await analytics.application_submitted("agent", gender.value)
     return {"message": "Agent registered successfully!"}
\ No newline at end of file
@@ -1,13 +1,17 @@
-from fastapi import APIRouter, Form
+from fastapi import APIRouter, Depends, Form
 from db import users_collection, application_forms_collection
+from pymongo.errors import DuplicateKeyError
 from fastapi import HTTPException, status
 from pydantic import BaseModel, EmailStr
 from typing import Annotated
 from enum import Enum
-import bcrypt
 import jwt
 import os
 from datetime import datetime, timedelta, timezone
+from services.passwords import hash_password, check_password, needs_rehash
+from services.admission import admit_ip
+from services import analytics
+from services.search import USER_FIELDS, search_terms
 
 users_router = APIRouter(tags=["Users"])
 
@@ -22,8 +26,8 @@ class UserRole(str, Enum):
     TRAINEE = "trainee"
 
 
-@users_router.post("/users/signup")
-def register_user(
+@users_router.post("/users/signup", dependencies=[Depends(admit_ip("auth"))])
+async def register_user(
         username: Annotated[str, Form()],
         email: Annotated[EmailStr, Form()],
         password: Annotated[str, Form(min_length=8)],
@@ -31,24 +35,10 @@ def register_user(
         passcode: Annotated[str, Form()],
         role: Annotated[UserRole, Form()] = UserRole.TRAINEE):
 
-    user_count = users_collection.count_documents({"email": email})
-    if user_count > 0:
-        raise HTTPException(status.HTTP_409_CONFLICT, "User already exists!")
-    
-    agent_in_forms = application_forms_collection.find_one({"email": email})
-    if not agent_in_forms and role == "agent":
-        raise HTTPException(status.HTTP_404_NOT_FOUND, "Agent hasn't applied")
-    
-    trainee_in_forms = application_forms_collection.find_one({"trainee_email": email})
-    if not trainee_in_forms and role == "trainee":
-        raise HTTPException(status.HTTP_404_NOT_FOUND, "Trainee hasn't applied")
-
     if password != confirm_password:
         raise HTTPException(status.HTTP_400_BAD_REQUEST,
                             "Passwords do not match!")
 
-    hash_password = bcrypt.hashpw(password.encode(), bcrypt.gensalt())
-
     if role == UserRole.TRAINEE:
         if passcode != os.getenv("TRAINEE_PASSCODE"):
             raise HTTPException(status.HTTP_403_FORBIDDEN, detail="Invalid or missing passcode!")
@@ -57,34 +47,62 @@ def register_user(
         if passcode != os.getenv("AGENT_PASSCODE"):
             raise HTTPException(status.HTTP_403_FORBIDDEN, detail="Invalid or missing passcode!")
 
+    # Agents and trainees must have applied first
+    application = None
+    if role == UserRole.AGENT:
+        application = await application_forms_collection.find_one(
+            {"email": email, "role": "agent"}, projection={"profession": 1})
+        if not application:
+            raise HTTPException(status.HTTP_404_NOT_FOUND, "Agent hasn't applied")
+
+    if role == UserRole.TRAINEE:
+        application = await application_forms_collection.find_one(
+            {"trainee_email": email, "role": "trainee"}, projection={"_id": 1})
+        if not application:
+            raise HTTPException(status.HTTP_404_NOT_FOUND, "Trainee hasn't applied")
+
+    hashed_password = await hash_password(password)
+
     user_created = {
         "username": username,
         "email": email,
-        "password": hash_password,
+        "password": hashed_password,
         "role": role,
         "passcode":passcode
     }
+    user_created["search_terms"] = search_terms(
+        {**user_created, "profession": application and application.get("profession")}, USER_FIELDS)
 
-    registered_user = users_collection.insert_one(user_created)
+    # The unique index on email rejects duplicate signups
+    try:
+        registered_user = await users_collection.insert_one(user_created)
+    except DuplicateKeyError:
+        raise HTTPException(status.HTTP_409_CONFLICT, "User already exists!")
+    await analytics.user_registered(role.value, registered_user.inserted_id)
 
     return {
         "message": "Signup successful",
         "user_id": str(registered_user.inserted_id)
     }
 
-@users_router.post("/users/login")
-def login_user(
+@users_router.post("/users/login", dependencies=[Depends(admit_ip("auth"))])
+async def login_user(
     email: Annotated[EmailStr, Form()],
     password: Annotated[str, Form(min_length=8)]
 ):
-    user = users_collection.find_one({"email": email})
+    user = await users_collection.find_one({"email": email})
     if not user:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "User not found!")
 
-    correct_password = bcrypt.checkpw(password.encode(), user["password"])
+    correct_password = await check_password(password, user["password"])
     if not correct_password:
         raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Wrong credentials!")
 
+    # Upgrade hashes made with a different BCRYPT_ROUNDS while we have the password
+    if needs_rehash(user["password"]):
+        await users_collection.update_one(
+            {"_id": user["_id"]}, {"$set": {"password": await hash_password(password)}})
+
 
     encoded_jwt = jwt.encode({
             "id": str(user["_id"]),
@@ -0,0 +1,148 @@
+from fastapi import Depends, HTTPException, Request, status
+from dependencies.authn import is_authenticated
+from services.cache import TTLCache
+from services.metrics import ADMISSION_REJECTIONS
+from typing import Annotated
+from contextlib import asynccontextmanager
+import asyncio
+import math
+import time
+import os
+
+
+ADMISSION_RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", "1"))
+
+# Route class -> defaults, each overridable as ADMISSION_<CLASS>_<SETTING>.
+# A concurrency or rate of 0 turns that limit off.
+DEFAULTS = {
+    "genai": {"concurrency": 20, "queue_timeout_seconds": 2, "rate_per_minute": 10, "burst": 5},
+    "upload": {"concurrency": 8, "queue_timeout_seconds": 5, "rate_per_minute": 20, "burst": 10},
+    "auth": {"concurrency": 16, "queue_timeout_seconds": 2, "rate_per_minute": 30, "burst": 10},
+}
+
+
+def _setting(route_class, name):
+    value = os.getenv(f"ADMISSION_{route_class.upper()}_{name.upper()}")
+    return float(value) if value is not None else DEFAULTS[route_class][name]
+
+
+class RouteClass:
+    """Concurrency cap plus a token bucket per caller for one class of routes.
+
+    Both are per process, so with several workers the effective limits are
+    multiplied by the worker count.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.concurrency = int(_setting(name, "concurrency"))
+        self.queue_timeout = _setting(name, "queue_timeout_seconds")
+        self.rate = _setting(name, "rate_per_minute") / 60
+        self.burst = _setting(name, "burst")
+        self.semaphore = asyncio.Semaphore(self.concurrency) if self.concurrency else None
+        # Idle buckets are full again after burst / rate seconds, drop them then
+        self.buckets = TTLCache(maxsize=100_000, ttl=self.burst / self.rate if self.rate else 0)
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = {"rate_limited": 0, "overloaded": 0}
+
+    def _take_token(self, key):
+        if not self.rate:
+            return
+        now = time.monotonic()
+        tokens, updated = self.buckets.get(key) or (self.burst, now)
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        if tokens < 1:
+            self.buckets.set(key, (tokens, now))
+            self._reject("rate_limited", status.HTTP_429_TOO_MANY_REQUESTS,
+                         "Too many requests, slow down", math.ceil((1 - tokens) / self.rate))
+        self.buckets.set(key, (tokens - 1, now))
+
+    def _refund_token(self, key):
+        # A request turned away for want of a slot never ran, it shouldn't cost the caller
+        if not self.rate:
+            return
+        bucket = self.buckets.get(key)
+        if bucket is not None:
+            tokens, updated = bucket
+            self.buckets.set(key, (min(self.burst, tokens + 1), updated))
+
+    async def _acquire(self):
+        if self.semaphore is None:
+            return
+        if not self.semaphore.locked():
+            await self.semaphore.acquire()
+            return
+        if not self.queue_timeout:
+            self._reject("overloaded", status.HTTP_503_SERVICE_UNAVAILABLE,
+                         "Server is busy, please retry", ADMISSION_RETRY_AFTER_SECONDS)
+        # Waiting a little smooths bursts; waiting forever is how p99 blows up
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._reject("overloaded", status.HTTP_503_SERVICE_UNAVAILABLE,
+                         "Server is busy, please retry", ADMISSION_RETRY_AFTER_SECONDS)
+        finally:
+            self.waiting -= 1
+
+    def _reject(self, reason, status_code, detail, retry_after):
+        self.rejected[reason] += 1
+        ADMISSION_REJECTIONS.labels(self.name, reason).inc()
+        raise HTTPException(status_code, detail=detail, headers={"Retry-After": str(max(retry_after, 1))})
+
+    @asynccontextmanager
+    async def admit(self, key):
+        self._take_token(key)
+        try:
+            await self._acquire()
+        except (HTTPException, asyncio.CancelledError):
+            self._refund_token(key)
+            raise
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            if self.semaphore is not None:
+                self.semaphore.release()
+
+    def stats(self):
+        return {
+            "concurrency": self.concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "rate_per_minute": self.rate * 60,
+            "burst": self.burst,
+            "tracked_callers": self.buckets.stats()["size"],
+            "rejected": dict(self.rejected),
+        }
+
+
+route_classes = {name: RouteClass(name) for name in DEFAULTS}
+
+
+def admit_user(route_class):
+    """Dependency limiting an authenticated route, bucketed per user."""
+    limiter = route_classes[route_class]
+
+    async def dependency(user_id: Annotated[str, Depends(is_authenticated)]):
+        async with limiter.admit(f"user:{user_id}"):
+            yield
+    return dependency
+
+
+def admit_ip(route_class):
+    """Dependency limiting a public route, bucketed per client address."""
+    limiter = route_classes[route_class]
+
+    async def dependency(request: Request):
+        # Behind a proxy run uvicorn with --proxy-headers so this is the real client
+        host = request.client.host if request.client else "unknown"
+        async with limiter.admit(f"ip:{host}"):
+            yield
+    return dependency
+
+
+def admission_stats():
+    return {name: limiter.stats() for name, limiter in route_classes.items()}
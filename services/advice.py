@@ -0,0 +1,200 @@
+from db import get_collection
+from services.cache import TTLCache
+from services.metrics import track_call
+from pymongo.errors import PyMongoError
+from datetime import datetime, timezone
+import logging
+import asyncio
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+GENAI_MODEL = os.getenv("GENAI_MODEL", "gemini-2.5-flash")
+ADVICE_CACHE_SIZE = int(os.getenv("ADVICE_CACHE_SIZE", "1000"))
+ADVICE_CACHE_TTL_SECONDS = float(os.getenv("ADVICE_CACHE_TTL_SECONDS", "86400"))
+# "mongo" keeps answers in the advice_cache collection so they survive restarts
+# and are shared between workers
+ADVICE_CACHE_PERSIST = os.getenv("ADVICE_CACHE_PERSIST", "none").lower()
+
+PROMPT_TEMPLATE = "Based on the topic {topic}, provide a detail to what the course is about and job availabilty in Ghana."
+
+
+# Only sentence punctuation around the topic, symbols inside or at the end
+# of a name matter ("C", "C#" and "C++" are different courses)
+_SURROUNDING_PUNCTUATION = " .,;:!?\"'()[]{}"
+
+
+def normalize_topic(prompt):
+    """Cache key for a prompt, the prompt itself is what goes to Gemini."""
+    # "Nursing!", " nursing " and "NURSING" all ask the same thing
+    return " ".join(prompt.lower().split()).strip(_SURROUNDING_PUNCTUATION)
+
+
+class AdviceService:
+    """Course advice from Gemini, cached by normalized topic.
+
+    Concurrent requests for a topic that isn't cached yet share a single
+    upstream call. Pass `client` to use something other than the real
+    genai client, e.g. a fake in tests.
+    """
+
+    def __init__(self, client=None):
+        self._client = client
+        self.cache = TTLCache(maxsize=ADVICE_CACHE_SIZE, ttl=ADVICE_CACHE_TTL_SECONDS)
+        self.persistent = get_collection("advice_cache") if ADVICE_CACHE_PERSIST == "mongo" else None
+        self._inflight = {}
+        self.upstream_calls = 0
+        self.coalesced = 0
+        self.persistent_hits = 0
+        self.stream_timings = {"streams": 0, "cancelled": 0, "first_token_seconds": 0.0, "total_seconds": 0.0}
+
+    @property
+    def client(self):
+        if self._client is None:
+            # The SDK is slow to import, only load it once advice is asked for
+            from google import genai
+            self._client = genai.Client()
+        return self._client
+
+    @client.setter
+    def client(self, client):
+        self._client = client
+
+    async def close(self):
+        client, self._client = self._client, None
+        if client is None:
+            return
+        # The SDK keeps separate HTTP pools for sync and async calls
+        if hasattr(getattr(client, "aio", None), "aclose"):
+            await client.aio.aclose()
+        if hasattr(client, "close"):
+            await asyncio.to_thread(client.close)
+
+    async def get_advice(self, prompt):
+        topic = normalize_topic(prompt)
+        text = self.cache.get(topic)
+        if text is not None:
+            return text
+
+        future = self._inflight.get(topic)
+        if future is None:
+            future = asyncio.ensure_future(self._fetch(topic, prompt))
+            self._inflight[topic] = future
+            future.add_done_callback(lambda _: self._inflight.pop(topic, None))
+        else:
+            self.coalesced += 1
+        # Shielded so one client disconnecting doesn't cancel the others' answer
+        return await asyncio.shield(future)
+
+    async def _fetch(self, topic, prompt):
+        text = await self._load(topic)
+        if text is None:
+            self.upstream_calls += 1
+            with track_call("genai", "generate"):
+                response = await self.client.aio.models.generate_content(
+                    model=GENAI_MODEL, contents=PROMPT_TEMPLATE.format(topic=prompt))
+            text = response.text
+            await self._store(topic, text)
+        self.cache.set(topic, text)
+        return text
+
+    async def stream_advice(self, prompt):
+        """Yield the advice text as Gemini generates it.
+
+        Cached answers come back as a single chunk. A stream is only cached
+        once it has completed.
+        """
+        topic = normalize_topic(prompt)
+        start = time.perf_counter()
+        text = self.cache.get(topic)
+        if text is None and topic in self._inflight:
+            self.coalesced += 1
+            text = await asyncio.shield(self._inflight[topic])
+        if text is None:
+            text = await self._load(topic)
+        if text is not None:
+            self._record_stream(start, start, completed=True)
+            yield text
+            return
+
+        self.upstream_calls += 1
+        with track_call("genai", "stream_start"):
+            stream = await self.client.aio.models.generate_content_stream(
+                model=GENAI_MODEL, contents=PROMPT_TEMPLATE.format(topic=prompt))
+        parts = []
+        first_token = None
+        completed = False
+        try:
+            async for chunk in stream:
+                if not chunk.text:
+                    continue
+                if first_token is None:
+                    first_token = time.perf_counter()
+                parts.append(chunk.text)
+                yield chunk.text
+            completed = True
+        finally:
+            # Runs on client disconnect too, stop pulling tokens we won't send
+            if not completed and hasattr(stream, "aclose"):
+                await stream.aclose()
+            self._record_stream(start, first_token, completed)
+
+        text = "".join(parts)
+        self.cache.set(topic, text)
+        await self._store(topic, text)
+
+    def _record_stream(self, start, first_token, completed):
+        end = time.perf_counter()
+        timings = self.stream_timings
+        timings["streams"] += 1
+        timings["cancelled"] += not completed
+        timings["first_token_seconds"] += (first_token or end) - start
+        timings["total_seconds"] += end - start
+        logger.info("Advice stream %s: first token %.3fs, total %.3fs",
+                    "completed" if completed else "cancelled", (first_token or end) - start, end - start)
+
+    async def _load(self, topic):
+        if self.persistent is None:
+            return None
+        try:
+            document = await self.persistent.find_one({"_id": topic})
+        except PyMongoError as e:
+            logger.warning("Advice cache lookup failed: %s", e)
+            return None
+        if document:
+            self.persistent_hits += 1
+            return document["text"]
+        return None
+
+    async def _store(self, topic, text):
+        if self.persistent is None:
+            return
+        try:
+            await self.persistent.replace_one(
+                {"_id": topic},
+                {"text": text, "created_at": datetime.now(tz=timezone.utc)},
+                upsert=True)
+        except PyMongoError as e:
+            logger.warning("Advice cache write failed: %s", e)
+
+    def stats(self):
+        streams = self.stream_timings["streams"]
+        return {
+            **self.cache.stats(),
+            "upstream_calls": self.upstream_calls,
+            "coalesced": self.coalesced,
+            "persistent_hits": self.persistent_hits,
+            "streams": self.stream_timings["streams"],
+            "streams_cancelled": self.stream_timings["cancelled"],
+            "avg_first_token_seconds": self.stream_timings["first_token_seconds"] / streams if streams else 0.0,
+            "avg_stream_seconds": self.stream_timings["total_seconds"] / streams if streams else 0.0,
+        }
+
+
+advice_service = AdviceService()
+
+
+def get_advice_service():
+    # Override with app.dependency_overrides to inject a fake client in tests
+    return advice_service
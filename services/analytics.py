@@ -0,0 +1,214 @@
+from db import application_forms_collection, users_collection, get_collection
+from services import assignments
+from pymongo.errors import PyMongoError
+from datetime import datetime, timezone
+import logging
+import asyncio
+import os
+
+logger = logging.getLogger(__name__)
+
+# How often the summary is recomputed from scratch to repair drift, 0 turns it off
+ANALYTICS_REBUILD_INTERVAL_SECONDS = float(os.getenv("ANALYTICS_REBUILD_INTERVAL_SECONDS", "3600"))
+
+# A single summary document, kept current by $inc on the write paths:
+#   applications.<role>.total / .pending_signup / .gender.<gender>
+#   users.<role>
+#   trainees_assigned
+#   agents.<agent id>   trainees assigned to that agent
+analytics_collection = get_collection("analytics")
+SUMMARY_ID = "summary"
+_rebuilder = None
+
+
+async def _apply(update):
+    # Counters are best effort, a failed $inc is repaired by the next rebuild
+    try:
+        await analytics_collection.update_one(
+            {"_id": SUMMARY_ID},
+            {**update, "$set": {"updated_at": datetime.now(tz=timezone.utc)}},
+            upsert=True)
+    except PyMongoError as e:
+        logger.warning("Analytics update failed: %s", e)
+
+
+async def application_submitted(role, gender):
+    await _apply({"$inc": {
+        f"applications.{role}.total": 1,
+        f"applications.{role}.pending_signup": 1,
+        f"applications.{role}.gender.{gender}": 1,
+    }})
+
+
+async def application_deleted(role, gender, signed_up):
+    counts = {f"applications.{role}.total": -1}
+    if gender:
+        counts[f"applications.{role}.gender.{gender}"] = -1
+    if not signed_up:
+        counts[f"applications.{role}.pending_signup"] = -1
+    await _apply({"$inc": counts})
+
+
+async def user_registered(role, user_id):
+    counts = {f"users.{role}": 1}
+    if role in ("agent", "trainee"):
+        counts[f"applications.{role}.pending_signup"] = -1
+    if role == "agent":
+        counts[f"agents.{user_id}"] = 0
+    await _apply({"$inc": counts})
+
+
+async def user_deleted(user, has_application):
+    counts = {f"users.{user['role']}": -1}
+    update = {"$inc": counts}
+    if has_application:
+        counts[f"applications.{user['role']}.pending_signup"] = 1
+    if user.get("agent_id"):
+        counts["trainees_assigned"] = -1
+        counts[f"agents.{user['agent_id']}"] = -1
+    if user["role"] == "agent":
+        update["$unset"] = {f"agents.{user['_id']}": ""}
+    await _apply(update)
+
+
+async def trainees_assigned(counts_by_agent):
+    counts = {f"agents.{agent_id}": count for agent_id, count in counts_by_agent.items()}
+    counts["trainees_assigned"] = sum(counts_by_agent.values())
+    await _apply({"$inc": counts})
+
+
+async def rebuild_summary():
+    """Recompute the whole summary with aggregations and replace the stored one.
+
+    Increments that land while this runs can be lost or double counted,
+    the next rebuild evens them out.
+    """
+    applications = {}
+    cursor = await application_forms_collection.aggregate([
+        {"$group": {
+            "_id": {"role": "$role", "gender": {"$ifNull": ["$trainee_gender", "$gender"]}},
+            "count": {"$sum": 1}
+        }}
+    ])
+    async for group in cursor:
+        role, gender = group["_id"].get("role"), group["_id"].get("gender")
+        counts = applications.setdefault(role, {"total": 0, "pending_signup": 0, "gender": {}})
+        counts["total"] += group["count"]
+        if gender:
+            counts["gender"][gender] = group["count"]
+
+    # Applicants whose email has no account yet
+    cursor = await application_forms_collection.aggregate([
+        {"$set": {"applicant_email": {"$ifNull": ["$trainee_email", "$email"]}}},
+        {"$lookup": {
+            "from": "users",
+            "localField": "applicant_email",
+            "foreignField": "email",
+            "as": "account"
+        }},
+        {"$match": {"account": {"$size": 0}}},
+        {"$group": {"_id": "$role", "count": {"$sum": 1}}}
+    ])
+    async for group in cursor:
+        applications.setdefault(group["_id"], {"total": 0, "pending_signup": 0, "gender": {}})
+        applications[group["_id"]]["pending_signup"] = group["count"]
+
+    users = {}
+    cursor = await users_collection.aggregate([{"$group": {"_id": "$role", "count": {"$sum": 1}}}])
+    async for group in cursor:
+        users[group["_id"]] = group["count"]
+
+    # Per-agent load and the total both come from trainees' agent_id, which
+    # every assignment has set, unlike the agent's trainees_assigned array
+    agents = {}
+    cursor = users_collection.find({"role": "agent"}, projection={"_id": 1})
+    async for agent in cursor:
+        agents[str(agent["_id"])] = 0
+    cursor = await users_collection.aggregate([
+        {"$match": {"role": "trainee", "agent_id": {"$ne": None}}},
+        {"$group": {"_id": "$agent_id", "count": {"$sum": 1}}}
+    ])
+    async for group in cursor:
+        if str(group["_id"]) in agents:
+            agents[str(group["_id"])] = group["count"]
+    assigned = sum(agents.values())
+
+    now = datetime.now(tz=timezone.utc)
+    summary = {
+        "applications": applications,
+        "users": users,
+        "trainees_assigned": assigned,
+        "agents": agents,
+        "updated_at": now,
+        "rebuilt_at": now,
+    }
+    await analytics_collection.replace_one({"_id": SUMMARY_ID}, summary, upsert=True)
+    return {"_id": SUMMARY_ID, **summary}
+
+
+async def get_summary():
+    summary = await analytics_collection.find_one({"_id": SUMMARY_ID})
+    if summary is None or "rebuilt_at" not in summary:
+        summary = await rebuild_summary()
+    return summary
+
+
+def report(summary):
+    """Shape the stored counters for the analytics endpoint."""
+    users = summary.get("users", {})
+    agents = summary.get("agents", {})
+    max_per_agent = assignments.MAX_TRAINEES_PER_AGENT
+    assigned = summary.get("trainees_assigned", 0)
+    capacity = len(agents) * max_per_agent
+    used = sum(agents.values())
+    return {
+        "applications": summary.get("applications", {}),
+        "users": users,
+        "trainees": {
+            "assigned": assigned,
+            "unassigned": max(users.get("trainee", 0) - assigned, 0),
+        },
+        "agent_capacity": {
+            "max_trainees_per_agent": max_per_agent,
+            "agents": len(agents),
+            "capacity": capacity,
+            "assigned": used,
+            "utilization": used / capacity if capacity else 0.0,
+            "full_agents": sum(count >= max_per_agent for count in agents.values()),
+            "per_agent": [
+                {"agent_id": agent_id, "assigned": count, "utilization": count / max_per_agent}
+                for agent_id, count in sorted(agents.items(), key=lambda item: -item[1])
+            ],
+        },
+        "updated_at": summary.get("updated_at"),
+        "rebuilt_at": summary.get("rebuilt_at"),
+    }
+
+
+async def _rebuild_periodically():
+    while True:
+        try:
+            summary = await analytics_collection.find_one({"_id": SUMMARY_ID}, projection={"rebuilt_at": 1})
+            rebuilt_at = summary.get("rebuilt_at") if summary else None
+            if rebuilt_at is not None and rebuilt_at.tzinfo is None:
+                rebuilt_at = rebuilt_at.replace(tzinfo=timezone.utc)
+            # Every worker runs this loop, whichever gets there first does the work
+            if rebuilt_at is None or (datetime.now(tz=timezone.utc) - rebuilt_at).total_seconds() >= ANALYTICS_REBUILD_INTERVAL_SECONDS:
+                await rebuild_summary()
+        except Exception:
+            logger.exception("Analytics rebuild failed")
+        await asyncio.sleep(ANALYTICS_REBUILD_INTERVAL_SECONDS)
+
+
+def start_rebuilder():
+    global _rebuilder
+    if ANALYTICS_REBUILD_INTERVAL_SECONDS:
+        _rebuilder = asyncio.create_task(_rebuild_periodically())
+
+
+async def stop_rebuilder():
+    global _rebuilder
+    if _rebuilder is not None:
+        _rebuilder.cancel()
+        await asyncio.gather(_rebuilder, return_exceptions=True)
+        _rebuilder = None
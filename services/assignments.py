@@ -0,0 +1,258 @@
+from db import users_collection, application_forms_collection, with_transaction
+from bson.objectid import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+import heapq
+import time
+from services.versions import bump, trainees_scope
+from services import analytics
+import os
+
+
+MAX_TRAINEES_PER_AGENT = int(os.getenv("MAX_TRAINEES_PER_AGENT", "5"))
+
+ASSIGNMENT_FIELDS = {"username": 1, "email": 1, "role": 1, "agent_id": 1, "trainees_assigned": 1}
+
+_backfilled = False
+
+
+class AssignmentConflict(Exception):
+    """Raised inside the transaction when another write got there first."""
+
+
+# Why a pair was rejected, alongside its human-readable detail
+INVALID_ID = "invalid_id"
+AGENT_NOT_FOUND = "agent_not_found"
+TRAINEE_NOT_FOUND = "trainee_not_found"
+ALREADY_ASSIGNED = "already_assigned"
+AGENT_FULL = "agent_full"
+
+
+async def backfill_trainees_assigned():
+    """Add every trainee with an agent_id to that agent's trainees_assigned.
+
+    Assignments made before trainees_assigned was kept only set agent_id on
+    the trainee, so without this those agents would look empty and take
+    trainees past the limit. $addToSet makes it safe to run again and
+    alongside new assignments. Returns how many agents changed.
+    """
+    global _backfilled
+    cursor = await users_collection.aggregate([
+        {"$match": {"role": "trainee", "agent_id": {"$ne": None}}},
+        {"$group": {"_id": "$agent_id", "trainees": {"$push": "$_id"}}},
+    ])
+    operations = [
+        UpdateOne({"_id": group["_id"], "role": "agent"},
+                  {"$addToSet": {"trainees_assigned": {"$each": group["trainees"]}}})
+        async for group in cursor
+    ]
+    modified = 0
+    if operations:
+        modified = (await users_collection.bulk_write(operations, ordered=False)).modified_count
+    _backfilled = True
+    return modified
+
+
+async def ensure_backfilled():
+    # Once per worker, before the first assignment reads capacity
+    if not _backfilled:
+        await backfill_trainees_assigned()
+
+
+def _validate(pairs, users):
+    load = {}
+    taken = set()
+    accepted = []
+    results = []
+    for agent_id, trainee_id in pairs:
+        result = {"agent_id": agent_id, "trainee_id": trainee_id, "status": "rejected", "reason": None, "detail": None}
+        results.append(result)
+        if not ObjectId.is_valid(agent_id) or not ObjectId.is_valid(trainee_id):
+            result["reason"], result["detail"] = INVALID_ID, "Invalid mongo id received"
+            continue
+
+        agent = users.get(ObjectId(agent_id))
+        trainee = users.get(ObjectId(trainee_id))
+        if not agent or agent["role"] != "agent":
+            result["reason"], result["detail"] = AGENT_NOT_FOUND, "Agent not found"
+            continue
+        if not trainee or trainee["role"] != "trainee":
+            result["reason"], result["detail"] = TRAINEE_NOT_FOUND, "Trainee not found"
+            continue
+        if trainee.get("agent_id") is not None or trainee["_id"] in taken:
+            result["reason"], result["detail"] = ALREADY_ASSIGNED, f"Trainee '{trainee['username']}' is already assigned to an agent."
+            continue
+
+        assigned = load.setdefault(agent["_id"], len(agent.get("trainees_assigned", [])))
+        if assigned >= MAX_TRAINEES_PER_AGENT:
+            result["reason"], result["detail"] = AGENT_FULL, f"Agent '{agent['username']}' has reached the maximum assignment limit of {MAX_TRAINEES_PER_AGENT}."
+            continue
+
+        load[agent["_id"]] += 1
+        taken.add(trainee["_id"])
+        accepted.append((result, agent, trainee))
+    return results, accepted
+
+
+def _operations(accepted):
+    operations = []
+    trainees_by_agent = {}
+    for _, agent, trainee in accepted:
+        # agent_id: None also guards against a concurrent assignment of the trainee
+        operations.append(UpdateOne(
+            {"_id": trainee["_id"], "role": "trainee", "agent_id": None},
+            {"$set": {
+                "agent_id": agent["_id"],
+                "agent_name": agent["username"],
+                "agent_email": agent["email"]
+            }}))
+        trainees_by_agent.setdefault(agent["_id"], []).append(trainee["_id"])
+
+    for agent_id, trainee_ids in trainees_by_agent.items():
+        # Only matches while the agent still has room for all of them
+        operations.append(UpdateOne(
+            {"_id": agent_id, "role": "agent",
+             f"trainees_assigned.{MAX_TRAINEES_PER_AGENT - len(trainee_ids)}": {"$exists": False}},
+            {"$push": {"trainees_assigned": {"$each": trainee_ids}}}))
+    return operations
+
+
+async def assign_trainees(pairs):
+    """Assign many (agent_id, trainee_id) pairs at once.
+
+    Every pair is validated against one $in lookup, then the valid ones are
+    written with a single bulk_write inside a transaction. Returns a result
+    per pair, in order, with status "assigned", "rejected" or "conflict".
+    """
+    await ensure_backfilled()
+    ids = {ObjectId(i) for pair in pairs for i in pair if ObjectId.is_valid(i)}
+    found = await users_collection.find(
+        {"_id": {"$in": list(ids)}}, projection=ASSIGNMENT_FIELDS).to_list()
+    results, accepted = _validate(pairs, {user["_id"]: user for user in found})
+    if not accepted:
+        return results
+
+    return await _commit(results, accepted)
+
+
+async def _commit(results, accepted):
+    operations = _operations(accepted)
+
+    async def write(session):
+        outcome = await users_collection.bulk_write(operations, ordered=True, session=session)
+        if outcome.matched_count != len(operations):
+            raise AssignmentConflict()
+
+    try:
+        await with_transaction(write)
+    except (AssignmentConflict, PyMongoError) as e:
+        # The driver already retried transient errors, still failing means we kept losing the race
+        if isinstance(e, PyMongoError) and not e.has_error_label("TransientTransactionError"):
+            raise
+        for result, _, _ in accepted:
+            result["status"] = "conflict"
+            result["detail"] = "Assignments changed while saving, please retry"
+        return results
+
+    await bump(*{trainees_scope(agent["_id"]) for _, agent, _ in accepted})
+    counts_by_agent = {}
+    for _, agent, _ in accepted:
+        counts_by_agent[agent["_id"]] = counts_by_agent.get(agent["_id"], 0) + 1
+    await analytics.trainees_assigned(counts_by_agent)
+    for result, agent, trainee in accepted:
+        result["status"] = "assigned"
+        result["detail"] = f"Agent '{agent['username']}' has been assigned to '{trainee['username']}'"
+    return results
+
+
+def plan_assignments(agents, trainees, profession_weights=None):
+    """Spread trainees over agents, always picking the least loaded agent.
+
+    agents are user documents with trainees_assigned and an optional
+    profession. An agent's load is its assigned count divided by the weight
+    of its profession (default 1), so weight 2 agents fill up twice as
+    fast and weight 0 leaves an agent out. A heap keeps each pick at
+    O(log m). Returns (agent, trainee) pairs in trainee order, stopping
+    early when every agent is full.
+    """
+    weights = {profession.lower(): weight for profession, weight in (profession_weights or {}).items()}
+    heap = []
+    for agent in agents:
+        weight = weights.get((agent.get("profession") or "").lower(), 1)
+        assigned = len(agent.get("trainees_assigned", []))
+        if weight > 0 and assigned < MAX_TRAINEES_PER_AGENT:
+            heap.append((assigned / weight, assigned, str(agent["_id"]), weight, agent))
+    heapq.heapify(heap)
+
+    plan = []
+    for trainee in trainees:
+        if not heap:
+            break
+        _, assigned, key, weight, agent = heap[0]
+        plan.append((agent, trainee))
+        assigned += 1
+        if assigned < MAX_TRAINEES_PER_AGENT:
+            heapq.heapreplace(heap, (assigned / weight, assigned, key, weight, agent))
+        else:
+            heapq.heappop(heap)
+    return plan
+
+
+async def auto_assign(dry_run=False, limit=None, profession_weights=None):
+    """Assign unassigned trainees to agents with room, oldest signups first.
+
+    Loads every candidate in one query per collection, plans with
+    plan_assignments and saves the plan through the same bulk write as
+    assign_trainees. With dry_run nothing is written, apart from the one-off
+    trainees_assigned backfill the capacity filter depends on.
+    """
+    timings = {}
+    start = time.perf_counter()
+    await ensure_backfilled()
+    agents = await users_collection.find(
+        {"role": "agent", f"trainees_assigned.{MAX_TRAINEES_PER_AGENT - 1}": {"$exists": False}},
+        projection=ASSIGNMENT_FIELDS).to_list()
+    trainees = users_collection.find(
+        {"role": "trainee", "agent_id": None}, projection=ASSIGNMENT_FIELDS).sort("_id", 1)
+    if limit:
+        trainees = trainees.limit(limit)
+    trainees = await trainees.to_list()
+    if profession_weights:
+        # Profession is on the agent's application, not their account
+        forms = await application_forms_collection.find(
+            {"role": "agent", "email": {"$in": [agent["email"] for agent in agents]}},
+            projection={"email": 1, "profession": 1}).to_list()
+        professions = {form["email"]: form.get("profession") for form in forms}
+        for agent in agents:
+            agent["profession"] = professions.get(agent["email"])
+    timings["load_ms"] = round((time.perf_counter() - start) * 1000, 2)
+
+    start = time.perf_counter()
+    plan = plan_assignments(agents, trainees, profession_weights)
+    timings["plan_ms"] = round((time.perf_counter() - start) * 1000, 2)
+
+    summary = {
+        "dry_run": dry_run,
+        "trainees_considered": len(trainees),
+        "agents_with_capacity": len(agents),
+        "planned": len(plan),
+        "plan": [{
+            "agent_id": agent["_id"], "agent": agent["username"],
+            "trainee_id": trainee["_id"], "trainee": trainee["username"]
+        } for agent, trainee in plan],
+        "timings": timings,
+    }
+    if dry_run or not plan:
+        summary["assigned"] = 0
+        return summary
+
+    start = time.perf_counter()
+    accepted = [({"agent_id": str(agent["_id"]), "trainee_id": str(trainee["_id"]),
+                  "status": "rejected", "reason": None, "detail": None}, agent, trainee)
+                for agent, trainee in plan]
+    results = await _commit([result for result, _, _ in accepted], accepted)
+    timings["commit_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    summary["assigned"] = sum(result["status"] == "assigned" for result in results)
+    if summary["assigned"] == 0:
+        summary["detail"] = "Assignments changed while saving, please retry"
+    return summary
@@ -0,0 +1,76 @@
+from db import application_forms_collection, users_collection, resources, progress_collection
+from utils import dump_json
+from datetime import datetime
+from enum import Enum
+import csv
+import io
+import os
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+EXPORT_MAX_BATCH_SIZE = int(os.getenv("EXPORT_MAX_BATCH_SIZE", "10000"))
+
+# Never exported, whatever the format
+HIDDEN_FIELDS = ("password", "passcode", "search_terms", "asset_ids", "asset_id")
+
+# Dataset -> (collection, CSV columns). NDJSON rows carry every field that isn't hidden.
+DATASETS = {
+    "forms": (application_forms_collection, [
+        "_id", "role",
+        "trainee_name", "trainee_email", "trainee_phone_number", "trainee_gender",
+        "parent_name", "parent_contact", "parent_occupation",
+        "full_name", "email", "phone", "profession", "years_of_experience", "gender",
+        "trainee_ghana_card", "trainee_birth_cert", "trainee_wassce_cert", "parent_ghana_card",
+        "ghana_card", "certificate", "created_at",
+    ]),
+    "users": (users_collection, [
+        "_id", "username", "email", "role", "agent_id", "agent_name", "agent_email", "trainees_assigned",
+    ]),
+    "resources": (resources, ["_id", "agent_id", "trainee_id", "task_type", "resource", "status"]),
+    "progress": (progress_collection, ["_id", "agent_id", "trainee_id", "resource_id", "is_accessed", "accessed_at"]),
+}
+
+
+def _cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return str(value.value)
+    if isinstance(value, list):
+        return ";".join(_cell(item) for item in value)
+    return str(value)
+
+
+async def _batches(dataset, filter, batch_size, projection):
+    collection, _ = DATASETS[dataset]
+    batch = []
+    async for document in collection.find(filter, projection=projection).sort("_id", 1).batch_size(batch_size):
+        batch.append(document)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def ndjson_rows(dataset, filter, batch_size):
+    """Yield the dataset as NDJSON, one chunk per batch, so memory doesn't grow with the row count."""
+    async for batch in _batches(dataset, filter, batch_size, dict.fromkeys(HIDDEN_FIELDS, 0)):
+        yield b"".join(dump_json(document) + b"\n" for document in batch)
+
+
+async def csv_rows(dataset, filter, batch_size):
+    _, columns = DATASETS[dataset]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    async for batch in _batches(dataset, filter, batch_size, dict.fromkeys(columns, 1)):
+        for document in batch:
+            writer.writerow([_cell(document.get(column)) for column in columns])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # Header only, the dataset was empty
+        yield buffer.getvalue()
@@ -0,0 +1,108 @@
+from pymongo import ASCENDING, TEXT, IndexModel
+from pymongo.errors import OperationFailure, PyMongoError
+from db import get_collection
+from services.advice import ADVICE_CACHE_TTL_SECONDS
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _unique_when_present(field):
+    # Trainee and agent forms share a collection but use different email
+    # fields, so only documents that actually have the field are constrained
+    return IndexModel([(field, ASCENDING)], name=f"{field}_unique", unique=True,
+                      partialFilterExpression={field: {"$type": "string"}})
+
+
+INDEXES = {
+    "users": [
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+        # The listings page in _id order, so the filter field leads and _id follows
+        IndexModel([("agent_id", ASCENDING), ("_id", ASCENDING)], name="agent_id_id"),
+        IndexModel([("role", ASCENDING), ("_id", ASCENDING)], name="role_id"),
+        IndexModel([("search_terms", ASCENDING)], name="search_terms"),
+        IndexModel([("username", TEXT), ("email", TEXT)], name="search_text",
+                   weights={"username": 3, "email": 2}),
+    ],
+    "application_forms": [
+        _unique_when_present("email"),
+        _unique_when_present("trainee_email"),
+        IndexModel([("role", ASCENDING), ("_id", ASCENDING)], name="role_id"),
+        # The gender filter is an $or over both fields, each branch walks its own index in _id order
+        IndexModel([("gender", ASCENDING), ("_id", ASCENDING)], name="gender_id"),
+        IndexModel([("trainee_gender", ASCENDING), ("_id", ASCENDING)], name="trainee_gender_id"),
+        IndexModel([("search_terms", ASCENDING)], name="search_terms"),
+        IndexModel([("trainee_name", TEXT), ("full_name", TEXT), ("parent_name", TEXT),
+                    ("trainee_email", TEXT), ("email", TEXT), ("profession", TEXT)],
+                   name="search_text",
+                   weights={"trainee_name": 3, "full_name": 3, "trainee_email": 2, "email": 2}),
+    ],
+    "resources": [
+        IndexModel([("agent_id", ASCENDING), ("trainee_id", ASCENDING)], name="agent_id_trainee_id"),
+        # Each dashboard pages through its own resources in _id order
+        IndexModel([("agent_id", ASCENDING), ("_id", ASCENDING)], name="agent_id_id"),
+        IndexModel([("trainee_id", ASCENDING), ("_id", ASCENDING)], name="trainee_id_id"),
+    ],
+    "progress": [
+        IndexModel([("trainee_id", ASCENDING), ("resource_id", ASCENDING)],
+                   name="trainee_id_resource_id_unique", unique=True),
+        IndexModel([("agent_id", ASCENDING), ("trainee_id", ASCENDING)], name="agent_id_trainee_id"),
+    ],
+    "transcript": [
+        # One transcript per trainee, concurrent first uploads can't both insert
+        IndexModel([("trainee_id", ASCENDING)], name="trainee_id_unique", unique=True),
+    ],
+    "advice_cache": [
+        IndexModel([("created_at", ASCENDING)], name="created_at_ttl",
+                   expireAfterSeconds=int(ADVICE_CACHE_TTL_SECONDS)),
+    ],
+}
+
+# Indexes superseded by one on the same keys with different options. MongoDB
+# won't build the new index while the old one exists, so the old one is dropped first
+REPLACED_INDEXES = {
+    "transcript": ["trainee_id"],
+}
+
+
+async def _drop_replaced(name):
+    collection = get_collection(name)
+    existing = await collection.index_information()
+    for index in REPLACED_INDEXES[name]:
+        if index in existing:
+            logger.info("Dropping index %s on %s, it has been replaced", index, name)
+            await collection.drop_index(index)
+
+
+async def missing_indexes():
+    missing = {}
+    for name, models in INDEXES.items():
+        existing = await get_collection(name).index_information()
+        absent = [m.document["name"] for m in models if m.document["name"] not in existing]
+        if absent:
+            missing[name] = absent
+    return missing
+
+
+async def ensure_indexes():
+    """Create any index in INDEXES that doesn't exist yet and report what is still missing.
+
+    Safe to run on every startup, existing indexes are left alone. Returns
+    None when MongoDB can't be reached, so the caller can try again later.
+    """
+    try:
+        for name, models in INDEXES.items():
+            try:
+                if name in REPLACED_INDEXES:
+                    await _drop_replaced(name)
+                await get_collection(name).create_indexes(models)
+            except OperationFailure as e:
+                # e.g. duplicates already in the collection block a unique index
+                logger.error("Could not create indexes on %s: %s", name, e)
+        missing = await missing_indexes()
+    except PyMongoError as e:
+        logger.error("Could not ensure indexes: %s", e)
+        return None
+    if missing:
+        logger.warning("Missing indexes: %s", missing)
+    return missing
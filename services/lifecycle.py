@@ -0,0 +1,137 @@
+from services.advice import advice_service
+from services.uploads import open_uploader, close_uploader
+from services import mailer
+from services.indexes import ensure_indexes
+from db import ping, close_client
+import logging
+import asyncio
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+# Off leaves every client to open on first use, as a single-process dev server would want
+WARM_CONNECTIONS = os.getenv("WARM_CONNECTIONS", "true").lower() != "false"
+# How long a worker waits for a client to connect at startup before serving anyway
+WARMUP_TIMEOUT_SECONDS = float(os.getenv("WARMUP_TIMEOUT_SECONDS", "10"))
+MONGO_ENSURE_INDEXES = os.getenv("MONGO_ENSURE_INDEXES", "true").lower() != "false"
+
+_indexes_ensured = not MONGO_ENSURE_INDEXES
+
+
+class Resource:
+    """An outside client a worker opens after it starts and closes on shutdown.
+
+    `configured` says whether the deployment uses it at all; `required`
+    ones have to be open before the worker reports itself ready.
+    """
+
+    def __init__(self, name, open, close, configured=True, required=False, check=None):
+        self.name = name
+        self._open = open
+        self._close = close
+        self._check = check
+        self.configured = configured
+        self.required = required
+        self.status = "closed" if configured else "not configured"
+        self.error = None
+        self.opened_in = None
+
+    async def open(self):
+        if not self.configured:
+            return
+        self.status = "opening"
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._open(), WARMUP_TIMEOUT_SECONDS)
+        except Exception as e:
+            self.status, self.error = "failed", str(e) or type(e).__name__
+            logger.warning("Could not open %s: %s", self.name, self.error)
+            return
+        self.status, self.error = "ready", None
+        self.opened_in = time.perf_counter() - start
+
+    async def check(self):
+        if self.status == "ready" and self._check is not None:
+            try:
+                await asyncio.wait_for(self._check(), WARMUP_TIMEOUT_SECONDS)
+            except Exception as e:
+                self.status, self.error = "failed", str(e) or type(e).__name__
+        elif self.status in ("closed", "failed"):
+            # Try again, a worker started while Mongo was down recovers once it's back
+            await self.open()
+
+    async def close(self):
+        if self.status == "closed" or not self.configured:
+            return
+        try:
+            await self._close()
+        except Exception:
+            logger.exception("Error closing %s", self.name)
+        self.status = "closed"
+
+    def describe(self):
+        return {"status": self.status, "required": self.required, "error": self.error,
+                "opened_in_seconds": self.opened_in}
+
+
+async def _open_genai():
+    # Creating the client imports the SDK and reads the API key
+    await asyncio.to_thread(lambda: advice_service.client)
+
+
+async def _open_cloudinary():
+    await asyncio.to_thread(open_uploader)
+
+
+async def _close_cloudinary():
+    await asyncio.to_thread(close_uploader)
+
+
+async def _noop():
+    pass
+
+
+MONGO = Resource("mongo", ping, close_client, required=True, check=ping)
+RESOURCES = [
+    MONGO,
+    Resource("genai", _open_genai, advice_service.close,
+             configured=bool(os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY"))),
+    Resource("cloudinary", _open_cloudinary, _close_cloudinary, configured=bool(os.getenv("CLOUD_NAME"))),
+    # The sessions themselves belong to the mail workers, which close them when they stop
+    Resource("smtp", mailer.open_connections, _noop, configured=bool(mailer.SMTP_HOST)),
+]
+
+
+async def open_resources():
+    """Open every client concurrently. Failures are logged and reported by readiness, not raised."""
+    if not WARM_CONNECTIONS:
+        return
+    await asyncio.gather(*(resource.open() for resource in RESOURCES))
+
+
+async def ensure_indexes_once():
+    """Create the indexes, unless a previous call already got through to MongoDB."""
+    global _indexes_ensured
+    # Don't sit through another server selection timeout when the ping just failed
+    if not _indexes_ensured and MONGO.status != "failed":
+        _indexes_ensured = await ensure_indexes() is not None
+
+
+async def close_resources():
+    for resource in reversed(RESOURCES):
+        await resource.close()
+
+
+async def readiness():
+    await asyncio.gather(*(resource.check() for resource in RESOURCES if resource.required))
+    ready = all(resource.status == "ready" for resource in RESOURCES if resource.required)
+    if ready:
+        # A worker that started while MongoDB was down skipped them
+        await ensure_indexes_once()
+    return ready, {
+        "ready": ready,
+        "pid": os.getpid(),
+        "indexes_ensured": _indexes_ensured,
+        "resources": {resource.name: resource.describe() for resource in RESOURCES},
+    }
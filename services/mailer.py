@@ -0,0 +1,156 @@
+from db import get_collection
+from services.metrics import track_call
+from datetime import datetime, timezone
+import logging
+import asyncio
+import smtplib
+import os
+
+logger = logging.getLogger(__name__)
+
+SMTP_HOST = os.getenv("SMTP_HOST")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_USERNAME = os.getenv("SMTP_USERNAME")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
+# Turn off to test against a plain local server such as aiosmtpd
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() != "false"
+SMTP_TIMEOUT_SECONDS = float(os.getenv("SMTP_TIMEOUT_SECONDS", "30"))
+MAIL_FROM = os.getenv("MAIL_FROM", "noreply@example.com")
+MAIL_WORKERS = int(os.getenv("MAIL_WORKERS", "2"))
+MAIL_QUEUE_SIZE = int(os.getenv("MAIL_QUEUE_SIZE", "10000"))
+MAIL_MAX_RETRIES = int(os.getenv("MAIL_MAX_RETRIES", "3"))
+MAIL_RETRY_BACKOFF_SECONDS = float(os.getenv("MAIL_RETRY_BACKOFF_SECONDS", "1"))
+
+email_jobs = get_collection("email_jobs")
+mail_queue = asyncio.Queue(maxsize=MAIL_QUEUE_SIZE)
+_workers = []
+_connections = []
+
+
+class SMTPConnection:
+    """An authenticated SMTP session kept open between messages."""
+
+    def __init__(self):
+        self._server = None
+
+    def open(self):
+        if self._server is None:
+            with track_call("smtp", "connect"):
+                self._server = self._connect()
+
+    def send(self, msg):
+        self.open()
+        try:
+            with track_call("smtp", "send"):
+                self._server.send_message(msg)
+        except (smtplib.SMTPServerDisconnected, OSError):
+            # Drop the dead session so the retry opens a fresh one
+            self._server = None
+            raise
+
+    def _connect(self):
+        server = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT_SECONDS)
+        if SMTP_STARTTLS:
+            server.starttls()
+        if SMTP_USERNAME:
+            server.login(SMTP_USERNAME, SMTP_PASSWORD)
+        return server
+
+    def close(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except smtplib.SMTPException:
+                pass
+            self._server = None
+
+
+async def _set_status(job_id, index, status, error=None):
+    await email_jobs.update_one(
+        {"_id": job_id},
+        {"$set": {f"recipients.{index}.status": status, f"recipients.{index}.error": error}})
+
+
+async def _deliver(connection, job_id, index, msg):
+    for attempt in range(MAIL_MAX_RETRIES + 1):
+        try:
+            await asyncio.to_thread(connection.send, msg)
+            await _set_status(job_id, index, "sent")
+            return
+        except smtplib.SMTPRecipientsRefused as e:
+            # Retrying won't change the server's mind about the address
+            await _set_status(job_id, index, "failed", str(e))
+            return
+        except (smtplib.SMTPException, OSError) as e:
+            if attempt == MAIL_MAX_RETRIES:
+                logger.error("Giving up on email to %s: %s", msg["To"], e)
+                await _set_status(job_id, index, "failed", str(e))
+                return
+            if not isinstance(e, smtplib.SMTPResponseException):
+                await asyncio.to_thread(connection.close)
+            await asyncio.sleep(MAIL_RETRY_BACKOFF_SECONDS * 2 ** attempt)
+
+
+async def _worker(connection):
+    try:
+        while True:
+            job_id, index, msg = await mail_queue.get()
+            try:
+                await _deliver(connection, job_id, index, msg)
+            except Exception:
+                logger.exception("Email worker failed on job %s", job_id)
+            finally:
+                mail_queue.task_done()
+    finally:
+        await asyncio.to_thread(connection.close)
+
+
+def start_workers():
+    for _ in range(MAIL_WORKERS):
+        connection = SMTPConnection()
+        _connections.append(connection)
+        _workers.append(asyncio.create_task(_worker(connection)))
+
+
+async def open_connections():
+    """Log every worker's SMTP session in now rather than on its first message."""
+    await asyncio.gather(*(asyncio.to_thread(connection.open) for connection in _connections))
+
+
+async def stop_workers(timeout=10):
+    # Give queued messages a chance to go out before shutting down
+    try:
+        await asyncio.wait_for(mail_queue.join(), timeout)
+    except asyncio.TimeoutError:
+        logger.warning("%s emails still queued at shutdown", mail_queue.qsize())
+    for worker in _workers:
+        worker.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+    _connections.clear()
+
+
+async def queue_messages(messages, not_found=()):
+    """Record a delivery job and hand its messages to the workers.
+
+    Returns the job id straight away; recipient statuses move from
+    "queued" to "sent" or "failed" as the workers get through them.
+    """
+    recipients = [{"email": msg["To"], "status": "queued", "error": None} for msg in messages]
+    recipients += [{"email": email, "status": "not_found", "error": None} for email in not_found]
+    job = await email_jobs.insert_one(
+        {"created_at": datetime.now(tz=timezone.utc), "recipients": recipients})
+
+    for index, msg in enumerate(messages):
+        msg["From"] = MAIL_FROM
+        try:
+            mail_queue.put_nowait((job.inserted_id, index, msg))
+        except asyncio.QueueFull:
+            recipients[index]["status"] = "failed"
+            await _set_status(job.inserted_id, index, "failed", "Mail queue is full")
+
+    return {"job_id": job.inserted_id, "recipients": recipients}
+
+
+async def get_job(job_id):
+    return await email_jobs.find_one({"_id": job_id})
@@ -0,0 +1,127 @@
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram,
+                               generate_latest, multiprocess)
+from pymongo import monitoring
+from contextlib import contextmanager
+from fastapi import Response
+import time
+import os
+
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Time spent handling a request",
+    ["method", "route", "status"])
+MONGO_COMMAND_LATENCY = Histogram(
+    "mongo_command_duration_seconds", "Time spent in a MongoDB command",
+    ["collection", "command", "outcome"],
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5))
+MONGO_DOCUMENTS_RETURNED = Counter(
+    "mongo_documents_returned_total", "Documents returned by MongoDB reads",
+    ["collection", "command"])
+EXTERNAL_CALL_LATENCY = Histogram(
+    "external_call_duration_seconds", "Time spent calling an outside service",
+    ["service", "operation", "outcome"],
+    buckets=(.01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60))
+ADMISSION_REJECTIONS = Counter(
+    "admission_rejections_total", "Requests turned away by admission control",
+    ["route_class", "reason"])
+
+
+class MetricsMiddleware:
+    """Record a latency histogram per route template and status code."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status_code = 500
+        start = time.perf_counter()
+
+        async def tracked_send(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, tracked_send)
+        finally:
+            # The router leaves the matched route in the scope, use its template
+            # so /users/<id> doesn't turn into one series per id
+            route = scope.get("route")
+            REQUEST_LATENCY.labels(
+                scope["method"], getattr(route, "path", "unmatched"), status_code,
+            ).observe(time.perf_counter() - start)
+
+
+def _collection(command_name, command):
+    if command_name == "getMore":
+        return command.get("collection", "")
+    value = command.get(command_name)
+    return value if isinstance(value, str) else ""
+
+
+def _documents_returned(reply):
+    cursor = reply.get("cursor")
+    if cursor:
+        return len(cursor.get("firstBatch") or cursor.get("nextBatch") or ())
+    if "value" in reply:
+        # findAndModify
+        return int(reply["value"] is not None)
+    return 0
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """Times every command the driver sends, per collection and command name."""
+
+    # Commands the driver sends on its own, not worth a series each
+    IGNORED = {"hello", "isMaster", "ping", "saslStart", "saslContinue", "endSessions", "buildInfo"}
+
+    def __init__(self):
+        self._inflight = {}
+
+    def started(self, event):
+        if event.command_name not in self.IGNORED:
+            self._inflight[(event.connection_id, event.request_id)] = _collection(
+                event.command_name, event.command)
+
+    def succeeded(self, event):
+        collection = self._inflight.pop((event.connection_id, event.request_id), None)
+        if collection is None:
+            return
+        MONGO_COMMAND_LATENCY.labels(collection, event.command_name, "success").observe(
+            event.duration_micros / 1e6)
+        documents = _documents_returned(event.reply)
+        if documents:
+            MONGO_DOCUMENTS_RETURNED.labels(collection, event.command_name).inc(documents)
+
+    def failed(self, event):
+        collection = self._inflight.pop((event.connection_id, event.request_id), None)
+        if collection is not None:
+            MONGO_COMMAND_LATENCY.labels(collection, event.command_name, "failure").observe(
+                event.duration_micros / 1e6)
+
+
+@contextmanager
+def track_call(service, operation):
+    """Time an outbound call, e.g. `with track_call("cloudinary", "upload"):`."""
+    start = time.perf_counter()
+    outcome = "failure"
+    try:
+        yield
+        outcome = "success"
+    finally:
+        EXTERNAL_CALL_LATENCY.labels(service, operation, outcome).observe(time.perf_counter() - start)
+
+
+def metrics_response():
+    # With several worker processes each writes its samples to
+    # PROMETHEUS_MULTIPROC_DIR and a scrape has to merge them
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
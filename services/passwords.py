@@ -0,0 +1,77 @@
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import asyncio
+import bcrypt
+import time
+import os
+
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+
+_pool = None
+_stats = {"queued": 0, "completed": 0, "total_seconds": 0.0, "max_seconds": 0.0}
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+def _check(password, hashed):
+    return bcrypt.checkpw(password, hashed)
+
+
+def get_pool():
+    # Created on first use so each server worker gets its own pool. Spawned
+    # rather than forked, the parent already runs the event loop and driver threads.
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=PASSWORD_HASH_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+
+async def _run(func, *args):
+    loop = asyncio.get_running_loop()
+    _stats["queued"] += 1
+    start = time.perf_counter()
+    try:
+        return await loop.run_in_executor(get_pool(), func, *args)
+    finally:
+        elapsed = time.perf_counter() - start
+        _stats["queued"] -= 1
+        _stats["completed"] += 1
+        _stats["total_seconds"] += elapsed
+        _stats["max_seconds"] = max(_stats["max_seconds"], elapsed)
+
+
+async def hash_password(password):
+    return await _run(_hash, password.encode(), BCRYPT_ROUNDS)
+
+
+async def check_password(password, hashed):
+    return await _run(_check, password.encode(), hashed)
+
+
+def needs_rehash(hashed):
+    # bcrypt hashes look like $2b$12$..., the second field is the cost
+    return int(hashed.split(b"$")[2]) != BCRYPT_ROUNDS
+
+
+def pool_stats():
+    completed = _stats["completed"]
+    return {
+        "workers": PASSWORD_HASH_WORKERS,
+        "rounds": BCRYPT_ROUNDS,
+        "queue_depth": _stats["queued"],
+        "completed": completed,
+        "avg_latency_seconds": _stats["total_seconds"] / completed if completed else 0.0,
+        "max_latency_seconds": _stats["max_seconds"],
+    }
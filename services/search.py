@@ -0,0 +1,186 @@
+from db import application_forms_collection, users_collection
+from pymongo import UpdateOne
+import unicodedata
+import re
+import os
+
+SEARCH_MAX_LIMIT = int(os.getenv("SEARCH_MAX_LIMIT", "50"))
+# Prefix matches fetched per collection before ranking
+SEARCH_CANDIDATES = int(os.getenv("SEARCH_CANDIDATES", "200"))
+
+# Fields searched in each collection and how much a match on each counts
+FORM_FIELDS = {
+    "trainee_name": 3, "full_name": 3, "parent_name": 1,
+    "trainee_email": 2, "email": 2,
+    "trainee_phone_number": 2, "phone": 2, "parent_contact": 1,
+    "profession": 1,
+}
+USER_FIELDS = {"username": 3, "email": 2, "profession": 1}
+
+PHONE_FIELDS = {"trainee_phone_number", "phone", "parent_contact"}
+
+
+def normalize(text):
+    # Lowercase and strip accents, so "Adwoa" and "ádwoa" meet
+    text = unicodedata.normalize("NFKD", str(text).lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def _phone_terms(value):
+    digits = re.sub(r"\D", "", str(value))
+    if not digits:
+        return []
+    terms = [digits]
+    # 024... and +233 24... are the same Ghanaian number
+    if digits.startswith("233"):
+        terms.append("0" + digits[3:])
+    elif digits.startswith("0"):
+        terms.append("233" + digits[1:])
+    return terms
+
+
+def _terms(field, value):
+    if not value:
+        return []
+    if field in PHONE_FIELDS:
+        return _phone_terms(value)
+    text = normalize(value)
+    terms = re.findall(r"\w+", text)
+    if "@" in text:
+        # The whole address too, so a pasted email is an exact term
+        terms.append(text.strip())
+    return terms
+
+
+def search_terms(document, fields):
+    """The normalized words of a document's searchable fields, stored as search_terms."""
+    terms = set()
+    for field in fields:
+        terms.update(_terms(field, document.get(field)))
+    return sorted(terms)
+
+
+def query_terms(query):
+    text = normalize(query)
+    terms = re.findall(r"[\w@.+-]+", text)
+    words = []
+    after_digits = False
+    for term in terms:
+        if re.fullmatch(r"\+?[\d-]+", term):
+            digits = re.sub(r"\D", "", term)
+            if after_digits:
+                # "024 123 4567" is one phone number, not three words
+                words[-1] += digits
+            elif digits:
+                words.append(digits)
+            after_digits = bool(words) and words[-1].isdigit()
+            continue
+        after_digits = False
+        if "@" in term:
+            words.append(term)
+        else:
+            words.extend(re.findall(r"\w+", term))
+    return [word for word in words if word]
+
+
+def _rank(document, words, fields):
+    score = 0.0
+    for field, weight in fields.items():
+        terms = _terms(field, document.get(field))
+        for word in words:
+            if word in terms:
+                score += 2 * weight
+            elif any(term.startswith(word) for term in terms):
+                score += weight
+    return score
+
+
+async def search_collection(collection, query, fields, limit, filter=None, projection=None):
+    """Ranked prefix search over a collection's search_terms.
+
+    Every query word has to prefix one of the document's terms. Anchored
+    regexes on the multikey search_terms index are range scans, so this
+    stays fast however big the collection. When that finds too little the
+    text index fills in, which also matches other forms of a word
+    ("nurses" for "nursing").
+    """
+    words = query_terms(query)
+    if not words:
+        return []
+    prefixes = [{"search_terms": re.compile("^" + re.escape(word))} for word in words]
+    candidates = await collection.find(
+        {**(filter or {}), "$and": prefixes},
+        projection=projection).limit(SEARCH_CANDIDATES).to_list()
+
+    if len(candidates) < limit:
+        seen = {document["_id"] for document in candidates}
+        text_matches = await collection.find(
+            {**(filter or {}), "$text": {"$search": " ".join(words)}},
+            projection={**(projection or {}), "score": {"$meta": "textScore"}},
+        ).sort([("score", {"$meta": "textScore"})]).limit(limit).to_list()
+        for document in text_matches:
+            if document["_id"] not in seen:
+                document.pop("score", None)
+                candidates.append(document)
+
+    for document in candidates:
+        document["score"] = _rank(document, words, fields)
+    candidates.sort(key=lambda document: document["score"], reverse=True)
+    return candidates[:limit]
+
+
+async def search_forms(query, limit, role=None):
+    filter = {"role": role} if role else None
+    return await search_collection(
+        application_forms_collection, query, FORM_FIELDS, limit, filter,
+        projection={"search_terms": 0, "asset_ids": 0})
+
+
+async def search_users(query, limit, role=None, hidden=()):
+    filter = {"role": role} if role else None
+    projection = dict.fromkeys(hidden, 0)
+    projection["search_terms"] = 0
+    return await search_collection(users_collection, query, USER_FIELDS, limit, filter, projection)
+
+
+async def _reindex(collection, fields, full, batch_size, extra=None):
+    filter = {} if full else {"search_terms": {"$exists": False}}
+    projection = dict.fromkeys(fields, 1)
+    updated = 0
+    batch = []
+    async for document in collection.find(filter, projection=projection).batch_size(batch_size):
+        batch.append(document)
+        if len(batch) == batch_size:
+            updated += await _write_terms(collection, batch, fields, extra)
+            batch = []
+    if batch:
+        updated += await _write_terms(collection, batch, fields, extra)
+    return updated
+
+
+async def _write_terms(collection, documents, fields, extra):
+    if extra:
+        await extra(documents)
+    result = await collection.bulk_write([
+        UpdateOne({"_id": document["_id"]}, {"$set": {"search_terms": search_terms(document, fields)}})
+        for document in documents
+    ], ordered=False)
+    return result.modified_count
+
+
+async def _add_professions(users):
+    # Agents' profession lives on their application form
+    emails = [user["email"] for user in users if user.get("email")]
+    forms = await application_forms_collection.find(
+        {"role": "agent", "email": {"$in": emails}}, projection={"email": 1, "profession": 1}).to_list()
+    professions = {form["email"]: form.get("profession") for form in forms}
+    for user in users:
+        user["profession"] = professions.get(user.get("email"))
+
+
+async def reindex(full=False, batch_size=1000):
+    """Fill in search_terms for documents written before search existed, or all of them with full."""
+    return {
+        "forms": await _reindex(application_forms_collection, FORM_FIELDS, full, batch_size),
+        "users": await _reindex(users_collection, USER_FIELDS, full, batch_size, extra=_add_professions),
+    }
@@ -0,0 +1,271 @@
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException, status
+from fastapi.responses import JSONResponse
+from pymongo import ReturnDocument
+from datetime import datetime, timezone
+from db import get_collection
+from services.metrics import track_call
+import functools
+import hashlib
+import asyncio
+import os
+
+
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "8"))
+UPLOAD_TIMEOUT_SECONDS = float(os.getenv("UPLOAD_TIMEOUT_SECONDS", "60"))
+# Files are sent to Cloudinary in chunks of this size (Cloudinary's minimum is 5MB)
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(6 * 1024 * 1024)))
+MAX_UPLOAD_FILE_BYTES = int(os.getenv("MAX_UPLOAD_FILE_BYTES", str(10 * 1024 * 1024)))
+MAX_UPLOAD_REQUEST_BYTES = int(os.getenv("MAX_UPLOAD_REQUEST_BYTES", str(45 * 1024 * 1024)))
+
+upload_executor = ThreadPoolExecutor(
+    max_workers=UPLOAD_WORKERS, thread_name_prefix="upload")
+
+# One document per distinct file content, keyed by its SHA-256:
+# {_id, public_id, resource_type, secure_url, bytes, refs, reuses, created_at}.
+# refs counts the forms, resources and transcripts pointing at the asset.
+assets = get_collection("assets")
+upload_counts = {"uploaded": 0, "uploaded_bytes": 0, "deduplicated": 0, "deduplicated_bytes": 0}
+
+
+class RequestTooLarge(HTTPException):
+    # An HTTPException so FastAPI lets it through if it's raised while parsing the form
+    def __init__(self):
+        super().__init__(
+            status.HTTP_413_CONTENT_TOO_LARGE,
+            detail=f"Request body exceeds {MAX_UPLOAD_REQUEST_BYTES} bytes",
+            headers={"Connection": "close"})
+
+
+class UploadSizeLimitMiddleware:
+    """Reject multipart bodies over MAX_UPLOAD_REQUEST_BYTES before they are parsed."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        if not headers.get(b"content-type", b"").startswith(b"multipart/"):
+            return await self.app(scope, receive, send)
+
+        content_length = headers.get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_REQUEST_BYTES:
+            return await self._reject(scope, receive, send)
+
+        # Chunked bodies have no length up front, count them as they arrive
+        received = 0
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            received += len(message.get("body", b""))
+            if received > MAX_UPLOAD_REQUEST_BYTES:
+                raise RequestTooLarge()
+            return message
+
+        async def tracked_send(message):
+            nonlocal response_started
+            response_started = message["type"] == "http.response.start" or response_started
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracked_send)
+        except RequestTooLarge:
+            if response_started:
+                raise
+            await self._reject(scope, receive, send)
+
+    async def _reject(self, scope, receive, send):
+        error = RequestTooLarge()
+        response = JSONResponse({"detail": error.detail}, status_code=error.status_code, headers=error.headers)
+        await response(scope, receive, send)
+
+
+def check_file_sizes(files):
+    for name, file in files.items():
+        if file.size is not None and file.size > MAX_UPLOAD_FILE_BYTES:
+            raise HTTPException(
+                status.HTTP_413_CONTENT_TOO_LARGE,
+                detail=f"'{name}' exceeds the {MAX_UPLOAD_FILE_BYTES} byte limit")
+
+
+@functools.cache
+def _uploader():
+    # Imported and configured on the first upload rather than at startup
+    import cloudinary
+    import cloudinary.uploader
+    cloudinary.config(
+        cloud_name = os.getenv("CLOUD_NAME"),
+        api_key = os.getenv("API_KEY"),
+        api_secret = os.getenv("API_SECRET"),
+        )
+    return cloudinary.uploader
+
+
+def open_uploader():
+    _uploader()
+
+
+def close_uploader():
+    if _uploader.cache_info().currsize:
+        # Drop the pooled HTTPS connections to the upload API
+        _uploader()._http.clear()
+        _uploader.cache_clear()
+
+
+def _upload_to_cloudinary(file):
+    # Read the spooled file in chunks instead of loading it whole into memory
+    file.file.seek(0)
+    with track_call("cloudinary", "upload"):
+        return _uploader().upload_large(
+            file.file,
+            filename=file.filename or "upload",
+            chunk_size=UPLOAD_CHUNK_SIZE,
+            resource_type="auto",
+            timeout=UPLOAD_TIMEOUT_SECONDS)
+
+
+def _destroy(upload_result):
+    with track_call("cloudinary", "destroy"):
+        _uploader().destroy(
+            upload_result["public_id"],
+            resource_type=upload_result.get("resource_type", "image"))
+
+
+def _discard_late_upload(future):
+    # Upload finished after the form was abandoned, remove the orphaned asset
+    if not future.cancelled() and future.exception() is None:
+        upload_executor.submit(_destroy, future.result())
+
+
+def _digest(file):
+    file.file.seek(0)
+    sha256 = hashlib.sha256()
+    size = 0
+    for chunk in iter(lambda: file.file.read(1024 * 1024), b""):
+        sha256.update(chunk)
+        size += len(chunk)
+    return sha256.hexdigest(), size
+
+
+def _asset_result(asset, deduplicated):
+    return {
+        "asset_id": asset["_id"],
+        "public_id": asset["public_id"],
+        "resource_type": asset["resource_type"],
+        "secure_url": asset["secure_url"],
+        "deduplicated": deduplicated,
+    }
+
+
+async def _upload(file):
+    loop = asyncio.get_running_loop()
+    digest, size = await loop.run_in_executor(upload_executor, _digest, file)
+    asset = await assets.find_one_and_update(
+        {"_id": digest, "refs": {"$gt": 0}},
+        {"$inc": {"refs": 1, "reuses": 1}},
+        return_document=ReturnDocument.AFTER)
+    if asset:
+        upload_counts["deduplicated"] += 1
+        upload_counts["deduplicated_bytes"] += size
+        return _asset_result(asset, deduplicated=True)
+
+    result = await _send(file)
+    upload_counts["uploaded"] += 1
+    upload_counts["uploaded_bytes"] += size
+    asset = await assets.find_one_and_update(
+        {"_id": digest},
+        {"$setOnInsert": {
+            "public_id": result["public_id"],
+            "resource_type": result.get("resource_type", "image"),
+            "secure_url": result["secure_url"],
+            "bytes": size,
+            "reuses": 0,
+            "created_at": datetime.now(tz=timezone.utc)
+        }, "$inc": {"refs": 1}},
+        upsert=True, return_document=ReturnDocument.AFTER)
+    if asset["public_id"] != result["public_id"]:
+        # The same bytes were uploaded concurrently and registered first, keep theirs
+        upload_executor.submit(_destroy, result)
+        return _asset_result(asset, deduplicated=True)
+    return _asset_result(asset, deduplicated=False)
+
+
+async def _send(file):
+    future = upload_executor.submit(_upload_to_cloudinary, file)
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(future), UPLOAD_TIMEOUT_SECONDS)
+    except BaseException:
+        # A running upload thread can't be interrupted, clean up after it instead
+        if not future.cancel():
+            future.add_done_callback(_discard_late_upload)
+        raise
+
+
+async def _release(asset_id):
+    asset = await assets.find_one_and_update(
+        {"_id": asset_id}, {"$inc": {"refs": -1}}, return_document=ReturnDocument.AFTER)
+    if asset is None or asset["refs"] > 0:
+        return
+    # Only the release that deletes the record destroys the file; an upload
+    # that took a new reference in between makes this match nothing
+    deleted = await assets.delete_one({"_id": asset_id, "refs": {"$lte": 0}})
+    if deleted.deleted_count:
+        await asyncio.get_running_loop().run_in_executor(upload_executor, _destroy, asset)
+
+
+async def release_assets(asset_ids):
+    """Drop one reference to each asset, destroying those nobody uses any more."""
+    await asyncio.gather(
+        *(_release(asset_id) for asset_id in asset_ids if asset_id),
+        return_exceptions=True)
+
+
+async def discard_uploads(upload_results):
+    await release_assets([result["asset_id"] for result in upload_results])
+
+
+async def upload_stats():
+    pipeline = [{"$group": {
+        "_id": None,
+        "assets": {"$sum": 1},
+        "stored_bytes": {"$sum": "$bytes"},
+        "reuses": {"$sum": "$reuses"},
+        "bytes_avoided": {"$sum": {"$multiply": ["$bytes", "$reuses"]}}
+    }}]
+    totals = await (await assets.aggregate(pipeline)).to_list()
+    totals = totals[0] if totals else {"assets": 0, "stored_bytes": 0, "reuses": 0, "bytes_avoided": 0}
+    totals.pop("_id", None)
+    # totals cover every worker since the assets collection was created,
+    # this_process is what this worker has seen since it started
+    return {**totals, "this_process": dict(upload_counts)}
+
+
+async def upload_files(files):
+    """Upload every file of a form at once, all or nothing.
+
+    Takes a dict of field name to UploadFile and returns a dict of field
+    name to {asset_id, public_id, resource_type, secure_url, deduplicated}.
+    Files whose content is already stored reuse that asset instead of
+    being uploaded again. Store asset_id with the document and pass it to
+    release_assets when the document goes away.
+    """
+    check_file_sizes(files)
+    tasks = {name: asyncio.create_task(_upload(file))
+             for name, file in files.items()}
+    try:
+        await asyncio.gather(*tasks.values())
+    except BaseException as e:
+        for task in tasks.values():
+            task.cancel()
+        results = await asyncio.gather(*tasks.values(), return_exceptions=True)
+        await discard_uploads([r for r in results if isinstance(r, dict)])
+        if isinstance(e, Exception):
+            raise HTTPException(
+                status.HTTP_502_BAD_GATEWAY, detail="Document upload failed, please try again") from e
+        raise
+
+    return {name: task.result() for name, task in tasks.items()}
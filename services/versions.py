@@ -0,0 +1,149 @@
+from db import MONGO_MODE, get_collection
+from fastapi import Request, Response, status
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+import logging
+import hashlib
+import asyncio
+
+logger = logging.getLogger(__name__)
+
+# One {_id: scope, version: n} document per cached listing scope, e.g.
+# "resources:<user id>" or "trainees:<agent id>". Write paths bump the scopes they touch.
+versions_collection = get_collection("versions")
+
+_versions = {}
+# True while the change stream keeps _versions in step with every worker's bumps
+_watching = False
+_watcher = None
+_listeners = []
+
+
+def resources_scope(user_id):
+    # The resources an agent assigned or a trainee was given
+    return f"resources:{user_id}"
+
+
+def trainees_scope(agent_id):
+    return f"trainees:{agent_id}"
+
+
+def progress_scope(user_id):
+    return f"progress:{user_id}"
+
+
+def user_scope(user_id):
+    # Bumped when an account is deleted, so every worker drops it from the auth cache
+    return f"user:{user_id}"
+
+
+def is_watching():
+    return _watching
+
+
+def on_change(callback):
+    """Call `callback(scope)` when a scope's version moves, whichever worker bumped it.
+
+    The scope is None when the change stream (re)starts, since changes may
+    have been missed while it was down.
+    """
+    _listeners.append(callback)
+
+
+def _notify(scope):
+    for callback in _listeners:
+        callback(scope)
+
+
+def _remember(scope, version):
+    # Change events and our own bumps can arrive in any order, never go back
+    if version > _versions.get(scope, 0):
+        _versions[scope] = version
+        _notify(scope)
+
+
+async def bump(*scopes):
+    for scope in scopes:
+        document = await versions_collection.find_one_and_update(
+            {"_id": scope}, {"$inc": {"version": 1}},
+            upsert=True, return_document=ReturnDocument.AFTER)
+        _remember(scope, document["version"])
+
+
+async def current_version(scope):
+    if _watching:
+        return _versions.get(scope, 0)
+    document = await versions_collection.find_one({"_id": scope})
+    return document["version"] if document else 0
+
+
+async def _watch():
+    global _watching
+    while True:
+        try:
+            async with await versions_collection.watch() as stream:
+                # Opened before loading so no bump falls between the two
+                async for document in versions_collection.find():
+                    _remember(document["_id"], document["version"])
+                _watching = True
+                _notify(None)
+                async for change in stream:
+                    if change["operationType"] == "insert":
+                        _remember(change["documentKey"]["_id"], change["fullDocument"]["version"])
+                    elif change["operationType"] == "update":
+                        version = change["updateDescription"]["updatedFields"].get("version")
+                        if version is not None:
+                            _remember(change["documentKey"]["_id"], version)
+        except asyncio.CancelledError:
+            raise
+        except PyMongoError as e:
+            logger.warning("Version change stream stopped, reading versions from Mongo: %s", e)
+        _watching = False
+        await asyncio.sleep(5)
+
+
+def start_watcher():
+    """Keep versions in memory so a 304 needs no Mongo round trip.
+
+    Needs change streams (a replica set, as Atlas is). Until the stream is
+    up, and in sync mode, every check reads the version document instead.
+    """
+    global _watcher
+    if MONGO_MODE != "sync":
+        _watcher = asyncio.create_task(_watch())
+
+
+async def stop_watcher():
+    global _watcher, _watching
+    if _watcher is not None:
+        _watcher.cancel()
+        await asyncio.gather(_watcher, return_exceptions=True)
+        _watcher = None
+    _watching = False
+
+
+async def listing_etag(request: Request, scope):
+    """A strong ETag for this exact URL at the scope's current version.
+
+    Read the version before querying, so a write racing the query gives an
+    older tag and the client just fetches again next time.
+    """
+    version = await current_version(scope)
+    url = f"{scope}|{request.url.path}?{request.url.query}"
+    return f'"{version}-{hashlib.blake2b(url.encode(), digest_size=8).hexdigest()}"'
+
+
+def not_modified(request: Request, etag):
+    """The 304 to send if the client already has `etag`, else None."""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return None
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    if etag in tags or "*" in tags:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers(etag))
+    return None
+
+
+def cache_headers(etag):
+    # Clients may keep the body but must check back before reusing it
+    return {"ETag": etag, "Cache-Control": "private, no-cache"}
@@ -0,0 +1,6 @@
+import os
+
+# Nothing connects at import time, but db and the auth dependencies read these
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+os.environ.setdefault("JWT_SECRET_KEY", "test-secret-key-test-secret-key-test")
+os.environ.setdefault("JWT_ALGORITHM", "HS256")
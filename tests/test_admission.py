@@ -0,0 +1,85 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from services import admission
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    def make(concurrency=1, queue_timeout=0, rate_per_minute=60, burst=2):
+        for name, value in {"concurrency": concurrency, "queue_timeout_seconds": queue_timeout,
+                            "rate_per_minute": rate_per_minute, "burst": burst}.items():
+            monkeypatch.setenv(f"ADMISSION_GENAI_{name.upper()}", str(value))
+        return admission.RouteClass("genai")
+    return make
+
+
+async def admitted(limiter, key):
+    async with limiter.admit(key):
+        pass
+
+
+def test_out_of_tokens_is_429_with_retry_after(limiter):
+    genai = limiter(concurrency=0, rate_per_minute=6, burst=2)
+    asyncio.run(admitted(genai, "user:a"))
+    asyncio.run(admitted(genai, "user:a"))
+    with pytest.raises(HTTPException) as rejected:
+        asyncio.run(admitted(genai, "user:a"))
+    assert rejected.value.status_code == 429
+    # One token comes back every 10 seconds
+    assert 9 <= int(rejected.value.headers["Retry-After"]) <= 10
+    # Buckets are per caller
+    asyncio.run(admitted(genai, "user:b"))
+    assert genai.rejected == {"rate_limited": 1, "overloaded": 0}
+
+
+def test_no_free_slot_is_503_and_keeps_the_token(limiter):
+    genai = limiter(concurrency=1, queue_timeout=0, burst=1)
+
+    async def run():
+        async with genai.admit("user:a"):
+            with pytest.raises(HTTPException) as rejected:
+                await admitted(genai, "user:b")
+        return rejected.value
+
+    rejected = asyncio.run(run())
+    assert rejected.status_code == 503
+    assert rejected.headers["Retry-After"] == str(admission.ADMISSION_RETRY_AFTER_SECONDS)
+    # user:b's only token was refunded, so they get in once the slot is free
+    asyncio.run(admitted(genai, "user:b"))
+    assert genai.rejected == {"rate_limited": 0, "overloaded": 1}
+
+
+def test_queue_timeout_is_503(limiter):
+    genai = limiter(concurrency=1, queue_timeout=0.01, rate_per_minute=0)
+
+    async def run():
+        async with genai.admit("user:a"):
+            with pytest.raises(HTTPException) as rejected:
+                await admitted(genai, "user:b")
+            assert genai.waiting == 0
+        return rejected.value
+
+    assert asyncio.run(run()).status_code == 503
+    assert genai.stats()["in_flight"] == 0
+
+
+def test_idle_buckets_expire_once_full_again(limiter, monkeypatch):
+    genai = limiter(concurrency=0, rate_per_minute=60, burst=2)
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+
+    asyncio.run(admitted(genai, "user:a"))
+    assert genai.stats()["tracked_callers"] == 1
+    assert genai.buckets.ttl == 2
+
+    now[0] += 3
+    assert genai.buckets.get("user:a") is None
+    # A caller coming back after expiry starts with a full bucket
+    asyncio.run(admitted(genai, "user:a"))
+    asyncio.run(admitted(genai, "user:a"))
+    with pytest.raises(HTTPException):
+        asyncio.run(admitted(genai, "user:a"))
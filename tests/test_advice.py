@@ -0,0 +1,55 @@
+import asyncio
+from types import SimpleNamespace
+
+from services.advice import PROMPT_TEMPLATE, AdviceService, normalize_topic
+
+
+class FakeModels:
+    def __init__(self):
+        self.prompts = []
+        self.release = asyncio.Event()
+
+    async def generate_content(self, model, contents):
+        self.prompts.append(contents)
+        await self.release.wait()
+        return SimpleNamespace(text=f"advice {len(self.prompts)}")
+
+
+def fake_client():
+    return SimpleNamespace(aio=SimpleNamespace(models=FakeModels()))
+
+
+def test_normalize_topic_keeps_symbols_in_names():
+    assert normalize_topic("  Nursing! ") == normalize_topic("NURSING") == "nursing"
+    assert normalize_topic("Data   Science?") == "data science"
+    assert len({normalize_topic(topic) for topic in ("C", "C#", "C++")}) == 3
+
+
+def test_similar_names_get_their_own_answers():
+    async def run():
+        client = fake_client()
+        client.aio.models.release.set()
+        service = AdviceService(client=client)
+        answers = [await service.get_advice(topic) for topic in ("C", "C#", "C++", "c++")]
+        return client.aio.models.prompts, answers
+
+    prompts, answers = asyncio.run(run())
+    assert answers == ["advice 1", "advice 2", "advice 3", "advice 3"]
+    # The prompt goes upstream as asked, not the cache key
+    assert prompts == [PROMPT_TEMPLATE.format(topic=topic) for topic in ("C", "C#", "C++")]
+
+
+def test_concurrent_requests_share_one_upstream_call():
+    async def run():
+        client = fake_client()
+        service = AdviceService(client=client)
+        waiting = [asyncio.ensure_future(service.get_advice(topic))
+                   for topic in ("Nursing", "nursing!", " NURSING ")]
+        await asyncio.sleep(0)
+        client.aio.models.release.set()
+        return client.aio.models.prompts, await asyncio.gather(*waiting), service.stats()
+
+    prompts, answers, stats = asyncio.run(run())
+    assert prompts == [PROMPT_TEMPLATE.format(topic="Nursing")]
+    assert answers == ["advice 1"] * 3
+    assert stats["upstream_calls"] == 1 and stats["coalesced"] == 2
@@ -0,0 +1,55 @@
+import asyncio
+
+from bson import ObjectId
+
+from services import analytics
+
+
+class Rows:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        for row in self.rows:
+            yield row
+
+
+class Collection:
+    def __init__(self, found=(), aggregated=()):
+        self.found = list(found)
+        self.aggregated = list(aggregated)
+        self.replaced = None
+
+    def find(self, filter, projection=None):
+        return Rows(self.found)
+
+    async def aggregate(self, pipeline):
+        return Rows(self.aggregated.pop(0))
+
+    async def replace_one(self, filter, document, upsert):
+        self.replaced = document
+
+
+def test_rebuild_counts_agent_load_and_total_from_trainees(monkeypatch):
+    busy, idle, gone = ObjectId(), ObjectId(), ObjectId()
+    users = Collection(
+        found=[{"_id": busy}, {"_id": idle}],
+        aggregated=[
+            [{"_id": "agent", "count": 2}, {"_id": "trainee", "count": 5}],
+            # Trainees of a deleted agent are not counted as assigned
+            [{"_id": busy, "count": 3}, {"_id": gone, "count": 1}],
+        ])
+    summaries = Collection()
+    monkeypatch.setattr(analytics, "application_forms_collection", Collection(aggregated=[[], []]))
+    monkeypatch.setattr(analytics, "users_collection", users)
+    monkeypatch.setattr(analytics, "analytics_collection", summaries)
+
+    summary = asyncio.run(analytics.rebuild_summary())
+    assert summary["agents"] == {str(busy): 3, str(idle): 0}
+    assert summary["trainees_assigned"] == 3
+    report = analytics.report(summary)
+    assert report["trainees"] == {"assigned": 3, "unassigned": 2}
+    assert report["agent_capacity"]["assigned"] == 3
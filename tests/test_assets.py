@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+from bson import ObjectId
+
+from dashboard import admin, agent, trainee
+
+
+@pytest.mark.parametrize("module, listing", [(agent, "get_all_resources"), (trainee, "get_resources")])
+@pytest.mark.parametrize("fields", [None, "resource,asset_id"])
+def test_resource_listings_hide_asset_id(monkeypatch, module, listing, fields):
+    projections = []
+
+    async def listing_etag(request, scope):
+        return "etag"
+
+    async def paginate(collection, filter, limit, after, projection):
+        projections.append(projection)
+        return {"items": [], "next_cursor": None}
+
+    monkeypatch.setattr(module, "listing_etag", listing_etag)
+    monkeypatch.setattr(module, "not_modified", lambda request, etag: None)
+    monkeypatch.setattr(module, "paginate", paginate)
+
+    asyncio.run(getattr(module, listing)(None, str(ObjectId()), limit=10, after=None,
+                                         task_type=None, resource_status=None, fields=fields))
+    assert projections == [{"resource": 1} if fields else {"asset_id": 0}]
+
+
+class Deleted:
+    def __init__(self, document):
+        self.document = document
+        self.deleted = []
+
+    async def find_one_and_delete(self, filter, projection=None):
+        self.deleted.append(filter)
+        return self.document
+
+    async def find_one(self, filter, projection=None):
+        return None
+
+
+def test_deleting_a_trainee_releases_their_transcript(monkeypatch):
+    trainee_id = ObjectId()
+    users = Deleted({"_id": trainee_id, "role": "trainee", "email": "t@example.com"})
+    transcripts = Deleted({"_id": ObjectId(), "asset_id": "transcript-asset"})
+    released = []
+
+    async def release_assets(asset_ids):
+        released.extend(asset_ids)
+
+    async def noop(*args, **kwargs):
+        pass
+
+    monkeypatch.setattr(admin, "users_collection", users)
+    monkeypatch.setattr(admin, "application_forms_collection", Deleted(None))
+    monkeypatch.setattr(admin, "transcript_collection", transcripts)
+    monkeypatch.setattr(admin, "release_assets", release_assets)
+    monkeypatch.setattr(admin, "invalidate_user", noop)
+    monkeypatch.setattr(admin.analytics, "user_deleted", noop)
+
+    asyncio.run(admin.delete_user(str(trainee_id)))
+    assert transcripts.deleted == [{"trainee_id": trainee_id}]
+    assert released == ["transcript-asset"]
@@ -0,0 +1,209 @@
+from bson.objectid import ObjectId
+from pymongo.errors import OperationFailure
+from services import assignments
+from services.assignments import _operations, _validate
+import asyncio
+import db
+import pytest
+
+
+def user(role, name, **fields):
+    return {"_id": ObjectId(), "role": role, "username": name, "email": f"{name}@example.com", **fields}
+
+
+@pytest.fixture
+def people():
+    agent = user("agent", "agent", trainees_assigned=[])
+    trainees = [user("trainee", f"trainee{i}", agent_id=None) for i in range(3)]
+    return agent, trainees
+
+
+def by_id(*users):
+    return {u["_id"]: u for u in users}
+
+
+def test_validate_accepts_valid_pairs(people):
+    agent, trainees = people
+    pairs = [(str(agent["_id"]), str(t["_id"])) for t in trainees]
+    results, accepted = _validate(pairs, by_id(agent, *trainees))
+    assert [r["reason"] for r in results] == [None, None, None]
+    assert [trainee for _, _, trainee in accepted] == trainees
+
+
+def test_validate_reasons(people, monkeypatch):
+    monkeypatch.setattr(assignments, "MAX_TRAINEES_PER_AGENT", 1)
+    agent, (first, second, assigned) = people
+    assigned["agent_id"] = ObjectId()
+    pairs = [
+        ("nope", str(first["_id"])),
+        (str(ObjectId()), str(first["_id"])),
+        (str(agent["_id"]), str(agent["_id"])),
+        (str(agent["_id"]), str(assigned["_id"])),
+        (str(agent["_id"]), str(first["_id"])),
+        (str(agent["_id"]), str(first["_id"])),
+        (str(agent["_id"]), str(second["_id"])),
+    ]
+    results, accepted = _validate(pairs, by_id(agent, first, second, assigned))
+    assert [r["reason"] for r in results] == [
+        "invalid_id", "agent_not_found", "trainee_not_found", "already_assigned",
+        None, "already_assigned", "agent_full",
+    ]
+    assert all(r["status"] == "rejected" for r in results)
+    assert len(accepted) == 1
+
+
+def test_operations_guard_trainee_and_agent_capacity(people, monkeypatch):
+    monkeypatch.setattr(assignments, "MAX_TRAINEES_PER_AGENT", 5)
+    agent, trainees = people
+    _, accepted = _validate([(str(agent["_id"]), str(t["_id"])) for t in trainees], by_id(agent, *trainees))
+    operations = _operations(accepted)
+
+    assert len(operations) == 4
+    for operation, trainee in zip(operations, trainees):
+        assert operation._filter == {"_id": trainee["_id"], "role": "trainee", "agent_id": None}
+        assert operation._doc["$set"]["agent_id"] == agent["_id"]
+    # One push per agent, only while it still has room for all three
+    assert operations[3]._filter == {"_id": agent["_id"], "role": "agent", "trainees_assigned.2": {"$exists": False}}
+    assert operations[3]._doc == {"$push": {"trainees_assigned": {"$each": [t["_id"] for t in trainees]}}}
+
+
+def test_commit_reports_transient_errors_as_conflict(people, monkeypatch):
+    agent, trainees = people
+    results, accepted = _validate([(str(agent["_id"]), str(trainees[0]["_id"]))], by_id(agent, *trainees))
+
+    async def write_conflict(callback):
+        raise OperationFailure("WriteConflict", code=112, details={"errorLabels": ["TransientTransactionError"]})
+
+    monkeypatch.setattr(assignments, "with_transaction", write_conflict)
+    results = asyncio.run(assignments._commit(results, accepted))
+    assert results[0]["status"] == "conflict"
+
+
+def test_commit_raises_other_errors(people, monkeypatch):
+    agent, trainees = people
+    results, accepted = _validate([(str(agent["_id"]), str(trainees[0]["_id"]))], by_id(agent, *trainees))
+
+    async def failure(callback):
+        raise OperationFailure("Unauthorized", code=13)
+
+    monkeypatch.setattr(assignments, "with_transaction", failure)
+    with pytest.raises(OperationFailure):
+        asyncio.run(assignments._commit(results, accepted))
+
+
+class FakeSession:
+    """Retries the callback once, like the driver does after a write conflict."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def with_transaction(self, callback):
+        callback(self)
+        return callback(self)
+
+
+class FakeClient:
+    def start_session(self):
+        return FakeSession()
+
+
+def test_sync_mode_runs_async_callback_through_driver_retries(monkeypatch):
+    monkeypatch.setattr(db, "MONGO_MODE", "sync")
+    monkeypatch.setattr(db, "get_client", FakeClient)
+    calls = []
+
+    async def callback(session):
+        calls.append(session)
+        return len(calls)
+
+    assert asyncio.run(db.with_transaction(callback)) == 2
+    assert len(calls) == 2
+
+
+class LegacyUsers:
+    """Trainees assigned before trainees_assigned was kept: agent_id only."""
+
+    def __init__(self, groups):
+        self.groups = groups
+        self.writes = []
+        self.aggregations = 0
+
+    async def aggregate(self, pipeline):
+        self.aggregations += 1
+        groups = self.groups
+
+        class Cursor:
+            def __aiter__(self):
+                return self._iter()
+
+            async def _iter(self):
+                for group in groups:
+                    yield group
+        return Cursor()
+
+    async def bulk_write(self, operations, ordered):
+        self.writes.extend(operations)
+
+        class Result:
+            modified_count = len(operations)
+        return Result()
+
+
+def test_backfill_adds_legacy_trainees_to_their_agents(monkeypatch):
+    agent_id, trainee_ids = ObjectId(), [ObjectId(), ObjectId()]
+    users = LegacyUsers([{"_id": agent_id, "trainees": trainee_ids}])
+    monkeypatch.setattr(assignments, "users_collection", users)
+    monkeypatch.setattr(assignments, "_backfilled", False)
+
+    assert asyncio.run(assignments.backfill_trainees_assigned()) == 1
+    [operation] = users.writes
+    assert operation._filter == {"_id": agent_id, "role": "agent"}
+    assert operation._doc == {"$addToSet": {"trainees_assigned": {"$each": trainee_ids}}}
+
+    # Runs once per worker
+    asyncio.run(assignments.ensure_backfilled())
+    assert users.aggregations == 1
+
+
+def test_backfill_with_nothing_to_do(monkeypatch):
+    users = LegacyUsers([])
+    monkeypatch.setattr(assignments, "users_collection", users)
+    monkeypatch.setattr(assignments, "_backfilled", False)
+    assert asyncio.run(assignments.backfill_trainees_assigned()) == 0
+    assert users.writes == []
+    assert assignments._backfilled
+
+
+class Found:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def sort(self, *args):
+        return self
+
+    def limit(self, n):
+        return self
+
+    async def to_list(self):
+        return self.documents
+
+
+def test_auto_assign_backfills_before_reading_capacity(monkeypatch):
+    calls = []
+
+    async def backfill():
+        calls.append("backfill")
+
+    class Users:
+        def find(self, filter, projection):
+            calls.append(filter["role"])
+            return Found([])
+
+    monkeypatch.setattr(assignments, "ensure_backfilled", backfill)
+    monkeypatch.setattr(assignments, "users_collection", Users())
+    summary = asyncio.run(assignments.auto_assign(dry_run=True))
+    assert calls == ["backfill", "agent", "trainee"]
+    assert summary["planned"] == 0
@@ -0,0 +1,74 @@
+from bson.objectid import ObjectId
+from dependencies import authn
+from services import versions
+import asyncio
+import pytest
+
+USER_ID = str(ObjectId())
+
+
+class Users:
+    def __init__(self):
+        self.reads = 0
+
+    async def find_one(self, filter, projection):
+        self.reads += 1
+        return {"_id": filter["_id"], "username": "ama", "email": "ama@example.com", "role": "trainee"}
+
+
+@pytest.fixture
+def users(monkeypatch):
+    users = Users()
+    monkeypatch.setattr(authn, "users_collection", users)
+    monkeypatch.setattr(versions, "_versions", {})
+    monkeypatch.setattr(versions, "_watching", True)
+    authn.user_cache.clear()
+    yield users
+    authn.user_cache.clear()
+
+
+def lookup():
+    return asyncio.run(authn.authenticated_user(USER_ID))
+
+
+def test_cached_while_watching(users):
+    assert lookup()["role"] == "trainee"
+    lookup()
+    assert users.reads == 1
+
+
+def test_bump_from_another_worker_drops_the_user(users):
+    lookup()
+    # What the change stream delivers when another worker deletes the account
+    versions._remember(versions.user_scope(USER_ID), 1)
+    lookup()
+    assert users.reads == 2
+
+
+def test_stream_restart_clears_the_cache(users):
+    lookup()
+    versions._notify(None)
+    lookup()
+    assert users.reads == 2
+
+
+def test_short_ttl_without_the_change_stream(users, monkeypatch):
+    monkeypatch.setattr(versions, "_watching", False)
+    monkeypatch.setattr(authn, "AUTH_CACHE_UNWATCHED_TTL_SECONDS", 0)
+    lookup()
+    lookup()
+    assert users.reads == 2
+
+
+def test_invalidate_user_bumps_its_scope(users, monkeypatch):
+    bumped = []
+
+    async def bump(*scopes):
+        bumped.extend(scopes)
+
+    monkeypatch.setattr(versions, "bump", bump)
+    lookup()
+    asyncio.run(authn.invalidate_user(ObjectId(USER_ID)))
+    assert bumped == [f"user:{USER_ID}"]
+    lookup()
+    assert users.reads == 2
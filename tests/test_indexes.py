@@ -0,0 +1,27 @@
+import asyncio
+
+from services import indexes
+
+
+class Collection:
+    def __init__(self, existing):
+        self.existing = existing
+        self.dropped = []
+
+    async def index_information(self):
+        return dict.fromkeys(self.existing, {})
+
+    async def drop_index(self, name):
+        self.dropped.append(name)
+
+
+def test_replaced_index_is_dropped_only_while_it_exists(monkeypatch):
+    transcripts = Collection(["_id_", "trainee_id"])
+    monkeypatch.setattr(indexes, "get_collection", lambda name: transcripts)
+
+    asyncio.run(indexes._drop_replaced("transcript"))
+    assert transcripts.dropped == ["trainee_id"]
+
+    transcripts.existing = ["_id_", "trainee_id_unique"]
+    asyncio.run(indexes._drop_replaced("transcript"))
+    assert transcripts.dropped == ["trainee_id"]
@@ -0,0 +1,71 @@
+from pymongo.errors import ServerSelectionTimeoutError
+from services import indexes, lifecycle
+import asyncio
+import pytest
+
+
+class Unreachable:
+    async def create_indexes(self, models):
+        raise ServerSelectionTimeoutError("No servers found")
+
+
+def test_ensure_indexes_survives_unreachable_mongo(monkeypatch):
+    monkeypatch.setattr(indexes, "get_collection", lambda name: Unreachable())
+    assert asyncio.run(indexes.ensure_indexes()) is None
+
+
+@pytest.fixture
+def mongo(monkeypatch):
+    state = {"up": False, "index_runs": 0}
+
+    async def ping():
+        if not state["up"]:
+            raise ServerSelectionTimeoutError("No servers found")
+
+    async def ensure_indexes():
+        state["index_runs"] += 1
+        return [] if state["up"] else None
+
+    monkeypatch.setattr(lifecycle.MONGO, "_open", ping)
+    monkeypatch.setattr(lifecycle.MONGO, "_check", ping)
+    monkeypatch.setattr(lifecycle.MONGO, "status", "closed")
+    monkeypatch.setattr(lifecycle, "RESOURCES", [lifecycle.MONGO])
+    monkeypatch.setattr(lifecycle, "WARM_CONNECTIONS", True)
+    monkeypatch.setattr(lifecycle, "ensure_indexes", ensure_indexes)
+    monkeypatch.setattr(lifecycle, "_indexes_ensured", False)
+    return state
+
+
+def test_worker_started_while_mongo_is_down_recovers(mongo):
+    async def scenario():
+        await lifecycle.open_resources()
+        await lifecycle.ensure_indexes_once()
+        assert lifecycle.MONGO.status == "failed"
+        # Not attempted, the ping already showed Mongo is unreachable
+        assert mongo["index_runs"] == 0
+
+        ready, report = await lifecycle.readiness()
+        assert not ready
+        assert report["resources"]["mongo"]["status"] == "failed"
+
+        mongo["up"] = True
+        ready, report = await lifecycle.readiness()
+        assert ready
+        assert report["indexes_ensured"]
+        assert mongo["index_runs"] == 1
+
+        await lifecycle.readiness()
+        assert mongo["index_runs"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_mongo_going_away_fails_readiness(mongo):
+    async def scenario():
+        mongo["up"] = True
+        await lifecycle.open_resources()
+        assert (await lifecycle.readiness())[0]
+        mongo["up"] = False
+        assert not (await lifecycle.readiness())[0]
+
+    asyncio.run(scenario())
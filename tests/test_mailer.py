@@ -0,0 +1,84 @@
+from email.message import EmailMessage
+from services import mailer
+import asyncio
+import socket
+import pytest
+
+controller_module = pytest.importorskip("aiosmtpd.controller")
+
+
+class Inbox:
+    def __init__(self):
+        self.messages = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(envelope)
+        return "250 OK"
+
+
+class FakeJobs:
+    """Just the email_jobs calls the mailer makes."""
+
+    def __init__(self):
+        self.jobs = {}
+
+    async def insert_one(self, document):
+        job_id = len(self.jobs) + 1
+        self.jobs[job_id] = document
+
+        class Result:
+            inserted_id = job_id
+        return Result()
+
+    async def find_one(self, filter):
+        return self.jobs[filter["_id"]]
+
+    async def update_one(self, filter, update):
+        job = self.jobs[filter["_id"]]
+        for key, value in update["$set"].items():
+            _, index, field = key.split(".")
+            job["recipients"][int(index)][field] = value
+
+
+@pytest.fixture
+def smtp(monkeypatch):
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    inbox = Inbox()
+    controller = controller_module.Controller(inbox, hostname="127.0.0.1", port=port)
+    controller.start()
+    monkeypatch.setattr(mailer, "SMTP_HOST", "127.0.0.1")
+    monkeypatch.setattr(mailer, "SMTP_PORT", port)
+    monkeypatch.setattr(mailer, "SMTP_STARTTLS", False)
+    monkeypatch.setattr(mailer, "SMTP_USERNAME", None)
+    monkeypatch.setattr(mailer, "email_jobs", FakeJobs())
+    yield inbox
+    controller.stop()
+
+
+def message(to):
+    msg = EmailMessage()
+    msg["To"] = to
+    msg["Subject"] = "Your passcode"
+    msg.set_content("1234")
+    return msg
+
+
+def test_queued_messages_are_delivered(smtp, monkeypatch):
+    # A fresh queue for this test's event loop
+    monkeypatch.setattr(mailer, "mail_queue", asyncio.Queue())
+
+    async def scenario():
+        mailer.start_workers()
+        await mailer.open_connections()
+        job = await mailer.queue_messages([message(f"user{i}@example.com") for i in range(5)],
+                                          not_found=["nobody@example.com"])
+        assert [r["status"] for r in job["recipients"]] == ["queued"] * 5 + ["not_found"]
+        await mailer.stop_workers()
+        return await mailer.get_job(job["job_id"])
+
+    job = asyncio.run(scenario())
+    assert [r["status"] for r in job["recipients"]] == ["sent"] * 5 + ["not_found"]
+    assert sorted(m.rcpt_tos[0] for m in smtp.messages) == [f"user{i}@example.com" for i in range(5)]
+    assert all(m.mail_from == mailer.MAIL_FROM for m in smtp.messages)
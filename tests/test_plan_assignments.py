@@ -0,0 +1,67 @@
+from services import assignments
+from services.assignments import plan_assignments
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def capacity(monkeypatch):
+    monkeypatch.setattr(assignments, "MAX_TRAINEES_PER_AGENT", 3)
+
+
+def agent(name, assigned=0, profession=None):
+    return {"_id": name, "username": name, "trainees_assigned": [f"{name}-t{i}" for i in range(assigned)],
+            "profession": profession}
+
+
+def trainees(count):
+    return [{"_id": f"trainee{i}"} for i in range(count)]
+
+
+def loads(plan):
+    counts = {}
+    for a, _ in plan:
+        counts[a["_id"]] = counts.get(a["_id"], 0) + 1
+    return counts
+
+
+def test_least_loaded_agent_first():
+    plan = plan_assignments([agent("a", 2), agent("b", 0), agent("c", 1)], trainees(3))
+    assert [a["_id"] for a, _ in plan] == ["b", "b", "c"]
+
+
+def test_keeps_trainee_order():
+    pool = trainees(4)
+    plan = plan_assignments([agent("a"), agent("b")], pool)
+    assert [t for _, t in plan] == pool
+
+
+def test_stops_when_every_agent_is_full():
+    plan = plan_assignments([agent("a", 1), agent("b", 3)], trainees(10))
+    assert loads(plan) == {"a": 2}
+
+
+def test_no_agents_or_no_trainees():
+    assert plan_assignments([], trainees(3)) == []
+    assert plan_assignments([agent("a")], []) == []
+
+
+def test_profession_weights():
+    agents = [agent("nurse", profession="Nursing"), agent("teacher", profession="teaching")]
+    plan = plan_assignments(agents, trainees(3), {"nursing": 2})
+    # Weight 2 fills twice as fast before the lighter agent gets a second trainee
+    assert loads(plan) == {"nurse": 2, "teacher": 1}
+
+
+def test_zero_weight_leaves_a_profession_out():
+    agents = [agent("nurse", profession="nursing"), agent("teacher", profession="teaching")]
+    plan = plan_assignments(agents, trainees(5), {"nursing": 0})
+    assert loads(plan) == {"teacher": 3}
+
+
+def test_never_exceeds_capacity():
+    agents = [agent(f"a{i}", i % 3) for i in range(50)]
+    plan = plan_assignments(agents, trainees(1000))
+    counts = loads(plan)
+    for a in agents:
+        assert len(a["trainees_assigned"]) + counts.get(a["_id"], 0) <= 3
+    assert sum(counts.values()) == sum(3 - len(a["trainees_assigned"]) for a in agents)
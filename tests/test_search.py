@@ -0,0 +1,97 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from bson.objectid import ObjectId
+from dependencies.authn import authenticated_user, is_authenticated
+from services.search import FORM_FIELDS, USER_FIELDS, _rank, query_terms, search_terms
+from dashboard import admin
+import pytest
+
+
+def matches(query, document, fields):
+    # What the $and of anchored regexes on search_terms does
+    terms = search_terms(document, fields)
+    return all(any(term.startswith(word) for term in terms) for word in query_terms(query))
+
+
+FORM = {
+    "trainee_name": "Ádwoa Mensah-Boateng",
+    "trainee_email": "Adwoa.M@Example.com",
+    "trainee_phone_number": "+233 24 123 4567",
+    "parent_name": "Kofi Mensah",
+    "role": "trainee",
+}
+
+
+def test_search_terms_are_normalized_words():
+    terms = search_terms(FORM, FORM_FIELDS)
+    assert {"adwoa", "mensah", "boateng", "kofi"} <= set(terms)
+    assert "adwoa.m@example.com" in terms
+    assert terms == sorted(set(terms))
+
+
+def test_phone_numbers_are_stored_in_both_forms():
+    terms = search_terms({"phone": "024-123-4567"}, FORM_FIELDS)
+    assert {"0241234567", "233241234567"} <= set(terms)
+
+
+def test_only_searched_fields_count():
+    assert search_terms({"username": "ama", "password": "secret"}, USER_FIELDS) == ["ama"]
+
+
+@pytest.mark.parametrize("query, words", [
+    ("Kwa Men", ["kwa", "men"]),
+    ("adwoa.m@example", ["adwoa.m@example"]),
+    ("024 123 4567", ["0241234567"]),
+    ("+233 24 123 4567", ["233241234567"]),
+    ("Kofi 024 123", ["kofi", "024123"]),
+    ("  ", []),
+])
+def test_query_terms(query, words):
+    assert query_terms(query) == words
+
+
+@pytest.mark.parametrize("query", ["adw men", "adwoa", "0241234567", "024 123 4567", "024 12",
+                                   "+233 24 123", "adwoa.m@exa", "boat"])
+def test_queries_match_the_form(query):
+    assert matches(query, FORM, FORM_FIELDS)
+
+
+@pytest.mark.parametrize("query", ["ama", "025 123", "mensah ama"])
+def test_queries_that_do_not_match(query):
+    assert not matches(query, FORM, FORM_FIELDS)
+
+
+def test_exact_name_ranks_above_prefix_and_parent():
+    words = query_terms("mensah")
+    exact = _rank({"trainee_name": "Ama Mensah"}, words, FORM_FIELDS)
+    prefix = _rank({"trainee_name": "Ama Mensaho"}, words, FORM_FIELDS)
+    parent = _rank({"trainee_name": "Ama Owusu", "parent_name": "Kofi Mensah"}, words, FORM_FIELDS)
+    assert exact > prefix > parent > 0
+
+
+@pytest.fixture
+def admin_client(monkeypatch):
+    projections = []
+
+    async def paginate(collection, filter, limit, after=None, projection=None):
+        projections.append(projection)
+        return {"items": [], "next_cursor": None}
+
+    monkeypatch.setattr(admin, "paginate", paginate)
+    app = FastAPI()
+    app.include_router(admin.admin_router)
+    admin_id = str(ObjectId())
+    app.dependency_overrides[is_authenticated] = lambda: admin_id
+    app.dependency_overrides[authenticated_user] = lambda: {"id": admin_id, "role": "admin"}
+    client = TestClient(app)
+    client.projections = projections
+    return client
+
+
+@pytest.mark.parametrize("path", ["/admin/users", "/admin/forms"])
+def test_listings_never_return_search_terms(admin_client, path):
+    assert admin_client.get(path).status_code == 200
+    assert admin_client.get(path, params={"fields": "search_terms,email"}).status_code == 200
+    default, requested = admin_client.projections
+    assert default["search_terms"] == 0
+    assert requested == {"email": 1}
@@ -0,0 +1,38 @@
+import asyncio
+
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+from dashboard import trainee
+
+
+class Transcripts:
+    """The first upsert loses a race with a concurrent first upload."""
+
+    def __init__(self):
+        self.calls = []
+
+    async def find_one_and_update(self, filter, update, upsert=False, projection=None):
+        self.calls.append(upsert)
+        if upsert:
+            raise DuplicateKeyError("E11000 duplicate key error")
+        return {"_id": ObjectId(), "asset_id": "from-the-other-upload"}
+
+
+def test_concurrent_first_upload_replaces_the_winner(monkeypatch):
+    transcripts, released = Transcripts(), []
+
+    async def upload_files(files):
+        return {"transcript": {"secure_url": "https://files/new.pdf", "asset_id": "new"}}
+
+    async def release_assets(asset_ids):
+        released.extend(asset_ids)
+
+    monkeypatch.setattr(trainee, "transcript_collection", transcripts)
+    monkeypatch.setattr(trainee, "upload_files", upload_files)
+    monkeypatch.setattr(trainee, "release_assets", release_assets)
+
+    response = asyncio.run(trainee.upload_transcript(str(ObjectId()), transcript=None))
+    assert response == {"message": "Transcript uploaded successfully"}
+    assert transcripts.calls == [True, False]
+    assert released == ["from-the-other-upload"]
@@ -0,0 +1,66 @@
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+from typing import Annotated
+from services import uploads
+from services.uploads import UploadSizeLimitMiddleware, check_file_sizes
+import pytest
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(uploads, "MAX_UPLOAD_REQUEST_BYTES", 1000)
+    monkeypatch.setattr(uploads, "MAX_UPLOAD_FILE_BYTES", 100)
+    app = FastAPI()
+    app.add_middleware(UploadSizeLimitMiddleware)
+
+    @app.post("/upload")
+    async def upload(document: Annotated[UploadFile, File()]):
+        check_file_sizes({"document": document})
+        return {"size": document.size}
+
+    return TestClient(app)
+
+
+def multipart(size):
+    boundary = "boundary"
+    body = (f"--{boundary}\r\n"
+            'Content-Disposition: form-data; name="document"; filename="a.pdf"\r\n'
+            "Content-Type: application/pdf\r\n\r\n").encode() + b"x" * size + f"\r\n--{boundary}--\r\n".encode()
+    return body, {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+
+
+def test_small_upload_passes(client):
+    body, headers = multipart(50)
+    response = client.post("/upload", content=body, headers=headers)
+    assert response.status_code == 200
+    assert response.json() == {"size": 50}
+
+
+def test_content_length_over_limit(client):
+    body, headers = multipart(2000)
+    response = client.post("/upload", content=body, headers=headers)
+    assert response.status_code == 413
+
+
+def test_chunked_body_over_limit(client):
+    body, headers = multipart(2000)
+
+    def chunks():
+        for start in range(0, len(body), 256):
+            yield body[start:start + 256]
+
+    response = client.post("/upload", content=chunks(), headers=headers)
+    assert response.status_code == 413
+    assert response.json()["detail"] == "Request body exceeds 1000 bytes"
+
+
+def test_file_over_limit(client):
+    body, headers = multipart(500)
+    response = client.post("/upload", content=body, headers=headers)
+    assert response.status_code == 413
+    assert "'document'" in response.json()["detail"]
+
+
+def test_other_content_types_are_not_limited(client):
+    response = client.post("/upload", json={"x": "y" * 2000})
+    assert response.status_code == 422
@@ -0,0 +1,72 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from bson.objectid import ObjectId
+from dependencies.authn import authenticated_user, is_authenticated
+from dashboard import trainee
+from services import versions
+import pytest
+
+TRAINEE_ID = str(ObjectId())
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # As if the change stream were up, so versions come from memory
+    monkeypatch.setattr(versions, "_watching", True)
+    monkeypatch.setattr(versions, "_versions", {})
+    queries = []
+
+    async def paginate(collection, filter, limit, after=None, projection=None):
+        queries.append(filter)
+        return {"items": [], "next_cursor": None}
+
+    monkeypatch.setattr(trainee, "paginate", paginate)
+    app = FastAPI()
+    app.include_router(trainee.trainee_router)
+    app.dependency_overrides[is_authenticated] = lambda: TRAINEE_ID
+    app.dependency_overrides[authenticated_user] = lambda: {"id": TRAINEE_ID, "role": "trainee"}
+    client = TestClient(app)
+    client.queries = queries
+    return client
+
+
+def test_etag_then_304(client):
+    first = client.get("/dashboard/trainee/resources")
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    assert first.headers["cache-control"] == "private, no-cache"
+
+    cached = client.get("/dashboard/trainee/resources", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.headers["etag"] == etag
+    assert cached.content == b""
+    # The 304 is answered before any query
+    assert len(client.queries) == 1
+
+    weak = client.get("/dashboard/trainee/resources", headers={"If-None-Match": f'"other", W/{etag}'})
+    assert weak.status_code == 304
+
+
+def test_listing_is_scoped_to_the_trainee(client):
+    client.get("/dashboard/trainee/resources")
+    assert client.queries == [{"trainee_id": ObjectId(TRAINEE_ID)}]
+
+
+def test_bump_invalidates_only_its_scope(client):
+    etag = client.get("/dashboard/trainee/resources").headers["etag"]
+
+    versions._remember(versions.resources_scope(str(ObjectId())), 1)
+    assert client.get("/dashboard/trainee/resources", headers={"If-None-Match": etag}).status_code == 304
+
+    versions._remember(versions.resources_scope(TRAINEE_ID), 1)
+    changed = client.get("/dashboard/trainee/resources", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+
+
+def test_etag_depends_on_the_query(client):
+    plain = client.get("/dashboard/trainee/resources").headers["etag"]
+    filtered = client.get("/dashboard/trainee/resources?task_type=quiz").headers["etag"]
+    assert plain != filtered
+    assert client.get("/dashboard/trainee/resources?task_type=quiz",
+                      headers={"If-None-Match": plain}).status_code == 200
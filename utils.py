@@ -1,11 +1,17 @@
 from bson.objectid import ObjectId
+from bson.decimal128 import Decimal128
 from fastapi import HTTPException, status
-from google import genai
+from fastapi.responses import JSONResponse
+import orjson
+import base64
 from dotenv import load_dotenv
+import os
 
 load_dotenv()
 
-genai_client = genai.Client()
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", "50"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "200"))
+
 
 def replace_user_id(user):
     user["id"] = str(user["_id"])
@@ -13,12 +19,6 @@ def replace_user_id(user):
     return user
 
 
-def replace_form_id(form):
-    form["id"] = str(form["_id"])
-    del form["_id"]
-    return form
-
-
 def valid_id(id):
     if not ObjectId.is_valid(id):
         raise HTTPException(
@@ -31,22 +31,57 @@ def two_valid_ids(first_id, second_id):
                 status.HTTP_422_UNPROCESSABLE_ENTITY, "Invalid mongo id received"
             )
 
-def serialize_user(user):
-    if not user:
-        return None
-    user["_id"] = str(user["_id"])
-    return user
+def bson_default(value):
+    # Called by orjson only for types it can't encode natively
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, bytes):
+        try:
+            return value.decode()
+        except UnicodeDecodeError:
+            return base64.b64encode(value).decode()
+    if isinstance(value, Decimal128):
+        return str(value)
+    raise TypeError
+
+
+def dump_json(content):
+    return orjson.dumps(content, default=bson_default,
+                        option=orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS)
+
+
+class MongoJSONResponse(JSONResponse):
+    """Encodes Mongo documents as they come from the driver.
+
+    ObjectId, datetime and bytes are converted while encoding, so there is
+    no copy pass over the documents. Return it directly from a handler,
+    a plain dict still goes through FastAPI's jsonable_encoder first.
+    """
+
+    def render(self, content):
+        return dump_json(content)
+
+def build_projection(fields, hidden=()):
+    """Turn a comma separated `fields` query param into a Mongo projection.
+
+    Fields in `hidden` are never returned, whether asked for or not.
+    """
+    if fields:
+        requested = [f.strip() for f in fields.split(",")
+                     if f.strip() and f.strip() not in hidden]
+        if requested:
+            return dict.fromkeys(requested, 1)
+    return dict.fromkeys(hidden, 0) or None
+
 
+async def paginate(collection, filter, limit, after=None, projection=None):
+    """Keyset pagination on _id, pass `next_cursor` back as `after` to get the next page."""
+    query = dict(filter)
+    if after:
+        valid_id(after)
+        query["_id"] = {"$gt": ObjectId(after)}
 
-def serialize_mongo_data(data):
-    if isinstance(data, list):
-        return [serialize_mongo_data(item) for item in data]
-    elif isinstance(data, dict):
-        return {
-            key: serialize_mongo_data(value)
-            for key, value in data.items()
-        }
-    elif isinstance(data, ObjectId):
-        return str(data)
-    else:
-        return data
\ No newline at end of file
+    # Fetch one extra document to know whether another page exists
+    documents = await collection.find(query, projection).sort("_id", 1).limit(limit + 1).to_list()
+    next_cursor = str(documents[limit - 1]["_id"]) if len(documents) > limit else None
+    return {"items": documents[:limit], "next_cursor": next_cursor}